@@ -125,7 +125,53 @@ EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 ADMINS = [('Test A. Admin', 'admin@test.com')]
 
 # Maximum size of file uploaded by user
-# 5242880 = 5 MB
-MAX_UPLOAD_SIZE = "5242880"
+# 15728640 = 15 MB, the csv files are read in chunks so this is only bounded by NGINX_MAX_UPLOAD (Dockerfile)
+MAX_UPLOAD_SIZE = "15728640"
+
+# Number of csv rows read and classified at a time by EditCsv.iter_predictions
+CSV_CHUNK_SIZE = 2048
 
 FILE_UPLOAD_TYPE = 'csv'
+
+# Classification model of each organisation, loaded once per process by Venter.ML_model.registry
+ML_MODELS = {
+    'ICMC': 'Venter.ML_model.model.ClassificationService.ClassificationService',
+    'SpeakUP': 'Venter.ML_model.SpeakUp.Model.SpeakupClassificationService.ClassificationService_speakup',
+}
+
+# Number of complaints sent to the classification graph in a single session call
+ML_BATCH_SIZE = 256
+
+# Prediction jobs, executed by `python manage.py run_prediction_worker`
+PREDICTION_MAX_CONCURRENT_JOBS = 2
+PREDICTION_WORKER_POLL_INTERVAL = 5
+
+# Predictions of already seen complaint texts, see Venter/ML_model/cache.py.
+# Number of probability vectors kept in memory by each model, and an optional SQLite file
+# shared by every process and kept across restarts (None to only cache in memory)
+PREDICTION_CACHE_SIZE = 100000
+PREDICTION_CACHE_SQLITE = os.environ.get('PREDICTION_CACHE_SQLITE') or None
+
+# Nearest neighbour search used to subcategorize the Novel responses of the Civis model,
+# 'exact' or the approximate 'lsh', see Venter/ML_model/Civis/neighbours.py for their OPTIONS
+CIVIS_NEIGHBOURS = {
+    'BACKEND': 'exact',
+    'OPTIONS': {'blockSize': 1024},
+}
+
+# Number of processes categorizing the domains of a Civis workbook in parallel, 1 to categorize them in turn.
+# The pool is forked from a thread of run_prediction_worker, forking while other jobs run threads can deadlock
+# the children: above 1, run_prediction_worker runs a single job at a time
+CIVIS_WORKERS = int(os.environ.get('CIVIS_WORKERS', 1))
+
+# GoogleNews word2vec model of the Civis model, it is only read by `python manage.py build_civis_vocabulary`
+# which keeps the CIVIS_WORDMODEL_VOCAB_SIZE most frequent words plus the words of the category files
+# and of the past uploads in CIVIS_WORDMODEL_STORE (.npy and .vocab.json), memory mapped by the model
+CIVIS_WORDMODEL = os.environ.get(
+    'CIVIS_WORDMODEL',
+    'E:/Me/IITB/Work/CIVIS/ML Approaches/word embeddings and similarity matrix/GoogleNews-vectors-negative300.bin')
+CIVIS_WORDMODEL_STORE = os.path.join(BASE_DIR, 'Venter', 'ML_model', 'Civis', 'data', 'wordmodel')
+CIVIS_WORDMODEL_VOCAB_SIZE = 200000
+
+# Number of files whose Civis results are kept in memory by each process, see Venter/result_store.py
+RESULT_CACHE_SIZE = 32
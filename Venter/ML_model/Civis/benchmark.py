@@ -0,0 +1,131 @@
+'''
+Benchmarks the response x category scoring of sentencemodel on the responses of a workbook,
+comparing the old per pair stopword filtering with the precomputed word sets.
+
+Run it from the project root:
+    python -m Venter.ML_model.Civis.benchmark [workbook] [--wordmodel GoogleNews-vectors-negative300.bin]
+
+The workbook defaults to the sample 'Responses_All About the RMP2031.xlsx'.
+
+Without a word model only the tokenization and stopword filtering is timed,
+the embedding lookups are replaced with a model that knows every word and scores 0.0.
+'''
+
+import argparse
+import os
+import time
+
+import django
+from nltk.corpus import stopwords
+
+# sentencemodel reads the settings of the project (word model store, neighbour search)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.settings')
+django.setup()
+
+from . import csvparser, sentencemodel
+
+sampleWorkbook = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Responses_All About the RMP2031.xlsx')
+
+
+class NullWordModel:
+    '''
+    Stands in for the gensim word model when none is given
+    '''
+    class Vocab:
+        def __contains__(self, word):
+            return True
+
+    vocab = Vocab()
+
+    def n_similarity(self, ws1, ws2):
+        return 0.0
+
+
+def legacySimilarityIndex(s1, s2, wordmodel):
+    '''
+    similarityIndex as it was before the preprocessing stage,
+    the stopword list is rebuilt for every word of both sentences
+    '''
+    if s1 == s2:
+        return 1.0
+
+    s1words = set(s1.split())
+    for word in s1words.copy():
+        if word in stopwords.words('english'):
+            s1words.remove(word)
+
+    s2words = set(s2.split())
+    for word in s2words.copy():
+        if word in stopwords.words('english'):
+            s2words.remove(word)
+
+    if len(s1words & s2words) == 0:
+        return 0.0
+
+    vocab = wordmodel.vocab
+    s1words = [word for word in s1words if word in vocab]
+    s2words = [word for word in s2words if word in vocab]
+
+    return wordmodel.n_similarity(s1words, s2words)
+
+
+def loadCorpus(workbook):
+    '''
+    Returns (domain, responses, categories) for every domain of the workbook with at least one response
+    '''
+    corpus = []
+    for domain, responses in sorted(csvparser.parse(workbook).items()):
+        if responses:
+            corpus.append((domain, responses, sentencemodel.readCategories(domain)))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('workbook', nargs='?', default=sampleWorkbook, help='Civis responses workbook')
+    parser.add_argument('--wordmodel', help='word2vec .bin file, the embedding lookups are skipped without it')
+    args = parser.parse_args()
+
+    corpus = loadCorpus(args.workbook)
+    if not corpus:
+        print('No responses found in %s.' % args.workbook)
+        return
+
+    if args.wordmodel:
+        from gensim.models import KeyedVectors
+        wordmodel = KeyedVectors.load_word2vec_format(args.wordmodel, binary=True)
+    else:
+        wordmodel = NullWordModel()
+
+    pairs = sum(len(responses) * len(categories) for _, responses, categories in corpus)
+    print('%d domains, %d response x category pairs' % (len(corpus), pairs))
+
+    st = time.time()
+    for _, responses, categories in corpus:
+        for response in responses:
+            for category in categories:
+                legacySimilarityIndex(response, category, wordmodel)
+    before = time.time() - st
+    print('Before (stopwords per word):   %f secs.' % before)
+
+    st = time.time()
+    for _, responses, categories in corpus:
+        responseSentences = [sentencemodel.preprocess(response) for response in responses]
+        categorySentences = [sentencemodel.preprocess(category) for category in categories]
+        for response in responseSentences:
+            for category in categorySentences:
+                sentencemodel.similarityIndex(response, category, wordmodel)
+    after = time.time() - st
+    print('After (precomputed word sets): %f secs. (%.1fx)' % (after, before / after if after else float('inf')))
+
+    if args.wordmodel:
+        st = time.time()
+        for _, responses, categories in corpus:
+            sentencemodel.similarityMatrix([sentencemodel.preprocess(response) for response in responses],
+                                           [sentencemodel.preprocess(category) for category in categories],
+                                           wordmodel)
+        print('Similarity matrix:             %f secs.' % (time.time() - st))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+'''
+Subcategorization of the Novel responses of a domain.
+
+Every Novel response is linked to its most similar Novel response, the subcategories are the
+connected components of these links. They are found with a disjoint-set (union-find) forest,
+near linear in the number of responses.
+'''
+
+import numpy as np
+
+
+class DisjointSet:
+    '''
+    Union-find forest over the integers 0..size-1, with path halving and union by size
+    '''
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def find(self, item):
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, item1, item2):
+        root1 = self.find(item1)
+        root2 = self.find(item2)
+        if root1 == root2:
+            return root1
+        if self.size[root1] < self.size[root2]:
+            root1, root2 = root2, root1
+        self.parent[root2] = root1
+        self.size[root1] += self.size[root2]
+        return root1
+
+
+def nearestNeighbours(scores, rows=None):
+    '''
+    Returns the column of the highest score of every row of scores, rows without any positive score
+    are their own neighbour. rows are the indices of the rows of scores, by default those of a square
+    similarity matrix
+    '''
+    scores = np.asarray(scores)
+    if rows is None:
+        rows = np.arange(len(scores))
+    if len(scores) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.where(scores.sum(axis=1) > 0, scores.argmax(axis=1), rows)
+
+
+def clusterNeighbours(responses, neighbours):
+    '''
+    Groups the responses linked by the (response, responses[neighbours[i]]) edges.
+    Equal responses are the same node, as they were in the sets of the former setlist merge.
+    Returns the groups as lists of distinct responses, the groups and their members being
+    ordered by first appearance in responses
+    '''
+    nodes = {}
+    for response in responses:
+        nodes.setdefault(response, len(nodes))
+
+    forest = DisjointSet(len(nodes))
+    for response, neighbour in zip(responses, neighbours):
+        forest.union(nodes[response], nodes[responses[neighbour]])
+
+    groups = {}
+    for response, node in nodes.items():
+        groups.setdefault(forest.find(node), []).append(response)
+    return list(groups.values())
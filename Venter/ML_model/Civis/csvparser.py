@@ -5,27 +5,52 @@ Created on Mon Feb 25 17:15:22 2019
 @author: Chintan Maniyar
 """
 
-import pandas as pd
-import re
+from openpyxl import load_workbook
+
+SHEET_NAME = 'Form responses 1'
+FEEDBACK_HEADER = 'Your Feedback'
+#cells read as missing values by pandas.read_excel, they are not responses
+MISSING_VALUES = frozenset(['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                            'N/A', 'NA', 'NULL', 'NaN', 'n/a', 'nan', 'null'])
+
+
+def feedbackColumns(domainHeader, questionHeader):
+    '''
+    Returns the [(column, domain)] of the feedback columns from the two header rows of the sheet,
+    the domain names are in merged cells so every column takes the last domain seen on its left
+    '''
+    columns = []
+    domain = None
+    for column, (domainCell, questionCell) in enumerate(zip(domainHeader, questionHeader)):
+        if domainCell is not None:
+            domain = str(domainCell).strip()
+        if domain is not None and str(questionCell).strip() == FEEDBACK_HEADER:
+            columns.append((column, domain))
+    return columns
+
 
 def parse(filepath):
     '''
-    This function parses the fed csv file and saves them separately, 
-    segregating the categories
-    Args(1) - csv filepath
+    This function parses the fed workbook and returns the responses of every domain,
+    segregating the categories, as a {domain: [responses]} dict
+    The sheet is streamed row by row in read only mode and only the feedback columns are kept,
+    so the memory used is the one of the responses
+    Args(1) - workbook filepath
     '''
-    xls = pd.ExcelFile(filepath)
-    df = pd.read_excel(xls, 'Form responses 1', header=[0,1])
-
-    headers = df.keys()[1:]
-    headers = headers[:len(headers)-3]
-    for h in headers[1::2]:
-        filename = str(h).split(',')[0].split('\'')[1] + '.txt'
-
-        file = open('Venter/ML_model/Civis/data/comments/' + filename, 'w', encoding='utf-8')
-        index = 1
-        print("Parsing " + filename + '...')
-        for sentence in df[h]:
-            if type(sentence) == str:
-                file.write(str(index) + '- ' + sentence.lstrip().replace('\n', ' ') + '\n')
-                index += 1
\ No newline at end of file
+    workbook = load_workbook(filepath, read_only=True)
+    try:
+        rows = workbook[SHEET_NAME].iter_rows(values_only=True)
+        domainHeader = next(rows, ())
+        questionHeader = next(rows, ())
+        columns = feedbackColumns(domainHeader, questionHeader)
+
+        domainResponses = {domain: [] for column, domain in columns}
+        for domain in domainResponses:
+            print("Parsing " + domain + '...')
+        for row in rows:
+            for column, domain in columns:
+                if column < len(row) and type(row[column]) == str and row[column] not in MISSING_VALUES:
+                    domainResponses[domain].append(row[column].lstrip().replace('\n', ' '))
+    finally:
+        workbook.close()
+    return domainResponses
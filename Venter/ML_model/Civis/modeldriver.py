@@ -1,25 +1,22 @@
-import pandas as pd
 from . import csvparser, sentencemodel
 
 class SimilarityMapping:
     '''
     This class consumes the model and sequences the flow of execution for the given input
     '''
-    def __init__(self, path):
+    def __init__(self, path, stateDirectory=None):
         self.filepath = path
+        #directory keeping the scores of the file between runs, see sentencemodel.categorizeDomain
+        self.stateDirectory = stateDirectory
 
-    def driver(self):
+    def driver(self, progress=None):
         '''
+        Runs the model over the input file and returns the results dict,
+        progress is handed over to sentencemodel.categorizer
         '''
 
         #parsing the input file for having sampled input to the model
-        csvparser.parse(self.filepath)
-        results = sentencemodel.categorizer()
+        domainResponses = csvparser.parse(self.filepath)
+        results = sentencemodel.categorizer(domainResponses, progress, stateDirectory=self.stateDirectory)
 
-        downloadOutput = pd.ExcelWriter('results.xlsx', engine='xlsxwriter')
-
-        for domain in results:
-            print('Writing Excel for domain %s' % domain)
-            df = pd.DataFrame({ key:pd.Series(value) for key, value in results[domain].items() })
-            df.to_excel(downloadOutput, sheet_name=domain)
-        downloadOutput.save()
+        return results
@@ -0,0 +1,144 @@
+'''
+Nearest neighbour search among the Novel responses of a domain.
+
+The scores are the ones of sentencemodel.similarityMatrix: the cosine of the sentence embeddings for the pairs
+sharing a word, 0.0 otherwise, 1.0 between equal sentences, and -1 between equal responses so that a response
+is not its own peer.
+The backends only compute blocks of rows of that matrix, never the whole n x n matrix:
+
+    exact - every row against every response, blockSize rows at a time, same result as the full matrix
+    lsh   - random hyperplane locality sensitive hashing of the embeddings, a row is only scored against
+            the responses falling in one of its buckets, the responses without any known word are bucketed
+            by sentence
+
+The backend is selected by settings.CIVIS_NEIGHBOURS, e.g. {'BACKEND': 'lsh', 'OPTIONS': {'bits': 10}}
+'''
+
+import numpy as np
+
+from .clustering import nearestNeighbours
+
+
+def textIds(texts):
+    '''
+    Returns an int array in which equal texts have equal ids, cheaper to compare than the texts
+    '''
+    ids = {}
+    return np.array([ids.setdefault(text, len(ids)) for text in texts], dtype=np.int64)
+
+
+def blockScores(rows, columns, embeddings, incidence, sentenceIds, responseIds):
+    '''
+    Returns the [len(rows), len(columns)] scores between the responses of the rows and columns index arrays
+    '''
+    shared = incidence[rows].dot(incidence[columns].T).toarray() > 0
+    scores = np.where(shared, embeddings[rows].dot(embeddings[columns].T), 0.0)
+    scores[sentenceIds[rows][:, None] == sentenceIds[columns][None, :]] = 1.0
+    scores[responseIds[rows][:, None] == responseIds[columns][None, :]] = -1
+    return scores
+
+
+def groups(indices, keys):
+    '''
+    Yields the arrays of the indices sharing a key, in increasing index order, for the keys of more than one index
+    '''
+    # mergesort is the stable sort of every numpy version, kind='stable' only exists from numpy 1.15
+    order = np.argsort(keys, kind='mergesort')
+    boundaries = np.flatnonzero(np.diff(keys[order])) + 1
+    for group in np.split(indices[order], boundaries):
+        if len(group) > 1:
+            yield group
+
+
+class ExactNeighbourSearch:
+    '''
+    Exact search, the rows are scored against all the responses blockSize rows at a time,
+    the memory used is blockSize x n scores instead of n x n
+    '''
+
+    def __init__(self, blockSize=1024):
+        self.blockSize = blockSize
+
+    def nearest(self, embeddings, incidence, sentences, responses):
+        '''
+        Returns the index of the most similar response of every response, the one of the highest score of its row,
+        embeddings and incidence being the sentenceEmbeddings and incidence matrix of the preprocessed sentences.
+        As in the former full matrix, rows without a positive sum are their own neighbour
+        '''
+        size = len(responses)
+        sentenceIds = textIds(sentence.text for sentence in sentences)
+        responseIds = textIds(responses)
+        columns = np.arange(size)
+        neighbours = np.arange(size)
+        for start in range(0, size, self.blockSize):
+            rows = np.arange(start, min(start + self.blockSize, size))
+            scores = blockScores(rows, columns, embeddings, incidence, sentenceIds, responseIds)
+            neighbours[rows] = nearestNeighbours(scores, rows)
+        return neighbours
+
+
+class LSHNeighbourSearch:
+    '''
+    Approximate search, the embeddings are hashed by the signs of their projections on bits random hyperplanes,
+    in tables independent hash tables. Similar responses are likely to share a bucket in at least one table,
+    a response is only scored against the responses of its buckets.
+    A response is linked to its best scoring candidate if that score is positive, to itself otherwise.
+    '''
+
+    def __init__(self, bits=8, tables=8, blockSize=1024, seed=0):
+        self.bits = bits
+        self.tables = tables
+        self.blockSize = blockSize
+        self.seed = seed
+
+    def buckets(self, embeddings, sentenceIds, random):
+        '''
+        Yields the index arrays of the responses sharing a hash code in one table, for every table
+        '''
+        hasEmbedding = np.any(embeddings != 0, axis=1)
+        # responses without any known word have a null embedding, which has no direction to hash.
+        # They only score 1.0 with the responses of an equal sentence, these are bucketed together
+        for bucket in groups(np.flatnonzero(~hasEmbedding), sentenceIds[~hasEmbedding]):
+            yield bucket
+
+        hashed = np.flatnonzero(hasEmbedding)
+        weights = 1 << np.arange(self.bits, dtype=np.int64)
+        for table in range(self.tables):
+            planes = random.randn(embeddings.shape[1], self.bits).astype(np.float32)
+            codes = (embeddings[hashed].dot(planes) > 0).dot(weights)
+            for bucket in groups(hashed, codes):
+                yield bucket
+
+    def nearest(self, embeddings, incidence, sentences, responses):
+        size = len(responses)
+        sentenceIds = textIds(sentence.text for sentence in sentences)
+        responseIds = textIds(responses)
+        neighbours = np.arange(size)
+        bestScores = np.zeros(size)
+        random = np.random.RandomState(self.seed)
+        for bucket in self.buckets(embeddings, sentenceIds, random):
+            for start in range(0, len(bucket), self.blockSize):
+                rows = bucket[start:start + self.blockSize]
+                scores = blockScores(rows, bucket, embeddings, incidence, sentenceIds, responseIds)
+                best = scores.argmax(axis=1)
+                rowScores = scores[np.arange(len(rows)), best]
+                better = rowScores > bestScores[rows]
+                neighbours[rows[better]] = bucket[best[better]]
+                bestScores[rows[better]] = rowScores[better]
+        return neighbours
+
+
+BACKENDS = {
+    'exact': ExactNeighbourSearch,
+    'lsh': LSHNeighbourSearch,
+}
+
+
+def createNeighbourSearch(backend='exact', **options):
+    '''
+    Returns the neighbour search registered under backend in BACKENDS, constructed with options
+    '''
+    if backend not in BACKENDS:
+        raise ValueError("Unknown neighbour search backend '%s', expected one of %s" % (
+            backend, ', '.join(sorted(BACKENDS))))
+    return BACKENDS[backend](**options)
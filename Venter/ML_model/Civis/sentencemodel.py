@@ -1,184 +1,353 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
-from nltk.corpus import wordnet as wn
 from nltk.corpus import stopwords
-from gensim.models import KeyedVectors
-from threading import Semaphore
-import os, json
-import warnings
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+import hashlib
+import json
+import os
 import time
 import numpy as np
+from scipy.sparse import csr_matrix
+
+from django.conf import settings
+
+from Venter.ML_model.embeddings import civis_embeddings
+from .clustering import clusterNeighbours
+from .neighbours import createNeighbourSearch
+
+CATEGORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'sentences')
+
+#a sentence kept next to its tokenized and stopword filtered set of words
+Sentence = namedtuple('Sentence', ['text', 'words'])
+
+
+@lru_cache(maxsize=None)
+def stopwordSet():
+    '''
+    Returns the english stopwords as a frozenset, read from nltk only once per process
+    '''
+    return frozenset(stopwords.words('english'))
+
+
+def preprocess(sentence):
+    '''
+    Tokenizes the sentence and removes the stopwords,
+    done once per sentence so that the similarity functions only work on the precomputed word sets
+    '''
+    return Sentence(sentence, frozenset(sentence.split()) - stopwordSet())
+
 
 def similarityIndex(s1, s2, wordmodel):
     '''
-    To compare the two sentences for their similarity using the gensim wordmodel
+    To compare the two preprocessed sentences for their similarity using the gensim wordmodel
     and return a similarity index
     '''
-    if s1 == s2:
+    if s1.text == s2.text:
         return 1.0
 
-    s1words = s1.split()
-    s2words = s2.split()
-
-    s1words = set(s1words)
-    for word in s1words.copy():
-        if word in stopwords.words('english'):
-            s1words.remove(word)
+    if len(s1.words & s2.words) == 0:
+        return 0.0
 
-    s2words = set(s2words)
-    for word in s2words.copy():
-        if word in stopwords.words('english'):
-            s2words.remove(word)
+    vocab = wordmodel.vocab
+    s1words = [word for word in s1.words if word in vocab]
+    s2words = [word for word in s2.words if word in vocab]
 
-    s1words = list(s1words)
-    s2words = list(s2words)
+    return wordmodel.n_similarity(s1words, s2words)
 
-    s1set = set(s1words)
-    s2set = set(s2words)
 
+def sentenceEmbedding(words, wordmodel):
+    '''
+    Returns the normalized mean of the word vectors of the given words,
+    words missing from the wordmodel vocabulary are skipped
+    '''
     vocab = wordmodel.vocab
+    vectors = [wordmodel[word] for word in words if word in vocab]
+    if not vectors:
+        return np.zeros(wordmodel.vector_size, dtype=np.float32)
+    embedding = np.mean(vectors, axis=0).astype(np.float32)
+    norm = np.linalg.norm(embedding)
+    if norm > 0:
+        embedding /= norm
+    return embedding
 
-    if len(s1set & s2set) == 0:
-        return 0.0
-    for word in s1set.copy():
-        if (word not in vocab):
-            s1words.remove(word)
-    for word in s2set.copy():
-        if (word not in vocab):
-            s2words.remove(word)
 
-    return wordmodel.n_similarity(s1words, s2words)
+def sentenceEmbeddings(sentences, wordmodel):
+    '''
+    Returns the [len(sentences), vector_size] float32 matrix of the sentenceEmbedding of every preprocessed sentence
+    '''
+    embeddings = np.zeros((len(sentences), wordmodel.vector_size), dtype=np.float32)
+    for row, sentence in enumerate(sentences):
+        embeddings[row] = sentenceEmbedding(sentence.words, wordmodel)
+    return embeddings
+
+
+def incidenceMatrices(*sentenceLists):
+    '''
+    Returns one sparse sentence x word incidence matrix per list of preprocessed sentences, over a common vocabulary,
+    the product of two of them is non zero for the pairs sharing at least one word
+    '''
+    wordIndex = {}
+    entries = []
+    for sentences in sentenceLists:
+        rows, columns = [], []
+        for row, sentence in enumerate(sentences):
+            for word in sentence.words:
+                rows.append(row)
+                columns.append(wordIndex.setdefault(word, len(wordIndex)))
+        entries.append((len(sentences), rows, columns))
+    return [csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, columns)), shape=(size, len(wordIndex)))
+            for size, rows, columns in entries]
+
+
+def similarityMatrix(sentences1, sentences2, wordmodel, embeddings1=None):
+    '''
+    Vectorized similarityIndex for every pair of preprocessed sentences1 x sentences2, returned as a numpy matrix.
+    Every sentence is embedded only once, the scores are then a single matrix product of the embeddings.
+    The rules of similarityIndex are kept: equal sentences score 1.0 and pairs without a common
+    non-stopword word score 0.0, pairs with nothing left in the vocabulary score 0.0 as well.
+    embeddings1, if given, are the already computed sentenceEmbeddings of sentences1
+    '''
+    incidence1, incidence2 = incidenceMatrices(sentences1, sentences2)
+    shared = incidence1.dot(incidence2.T).toarray() > 0
+
+    if embeddings1 is None:
+        embeddings1 = sentenceEmbeddings(sentences1, wordmodel)
+    embeddings2 = sentenceEmbeddings(sentences2, wordmodel)
+
+    matrix = np.where(shared, embeddings1.dot(embeddings2.T), 0.0)
+    texts1 = np.array([sentence.text for sentence in sentences1], dtype=object)
+    texts2 = np.array([sentence.text for sentence in sentences2], dtype=object)
+    matrix[texts1[:, None] == texts2[None, :]] = 1.0
+    return matrix
+
+
+def normalizeDomain(name):
+    '''
+    Returns the letters and digits of a domain name in lower case, 'Parks And Recreation' -> 'parksandrecreation'
+    '''
+    return ''.join(character for character in name.lower() if character.isalnum())
+
+
+def readCategories(domain):
+    '''
+    Returns the categories of the domain from its data/sentences/<normalized domain>_c.txt file,
+    an empty list when the domain has no category file
+    '''
+    categoryFiles = {normalizeDomain(filename[:-len('_c.txt')]): filename
+                     for filename in os.listdir(CATEGORY_PATH) if filename.endswith('_c.txt')}
+    filename = categoryFiles.get(normalizeDomain(domain))
+    if filename is None:
+        print('No category file found for %s domain, all its responses are novel.' % domain)
+        return []
+    with open(os.path.join(CATEGORY_PATH, filename), 'r', encoding='utf-8-sig') as temp:
+        return [category.strip() for category in temp.readlines() if category.strip()]
+
+
+def categoryWords():
+    '''
+    Returns the set of the words of every category file, they are always kept in the reduced word model
+    '''
+    words = set()
+    for filename in os.listdir(CATEGORY_PATH):
+        with open(os.path.join(CATEGORY_PATH, filename), 'r', encoding='utf-8-sig') as temp:
+            words.update(temp.read().split())
+    return words
+
+
+def domainStatePath(stateDirectory, domain):
+    return os.path.join(stateDirectory, normalizeDomain(domain) + '.npz')
+
+
+def responsesDigest(responses):
+    '''
+    Returns the sha1 of the responses, saved in place of the responses to recognize them on the next run
+    '''
+    return hashlib.sha1(json.dumps(list(responses)).encode('utf-8')).hexdigest()
+
+
+def loadDomainState(stateDirectory, domain, wordmodel, responses):
+    '''
+    Returns the response embeddings, the categories and the response x category scores saved by saveDomainState,
+    None if there are none or if they were computed for other responses or with another word model
+    '''
+    path = domainStatePath(stateDirectory, domain)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as state:
+        if wordmodel.version is None or str(state['wordmodel']) != wordmodel.version:
+            return None
+        if str(state['responses']) != responsesDigest(responses):
+            return None
+        return {
+            'embeddings': state['embeddings'],
+            'categories': [str(category) for category in state['categories']],
+            'scores': state['scores'],
+        }
+
+
+def saveDomainState(stateDirectory, domain, wordmodel, responses, embeddings, categories, scores):
+    '''
+    Saves what loadDomainState needs to only score the new categories of the domain on the next run
+    '''
+    os.makedirs(stateDirectory, exist_ok=True)
+    np.savez(domainStatePath(stateDirectory, domain), responses=np.array(responsesDigest(responses)),
+             embeddings=embeddings, categories=np.array(categories, dtype=str), scores=scores,
+             wordmodel=np.array(str(wordmodel.version)))
 
 
-def categorizer():
+def categorizeDomain(domain, responses, wordmodel, neighbourSearch, stateDirectory=None):
+    '''
+    Categorizes the responses of one domain,
+    returns the {category: [responses], 'Novel': {subcategory: [responses]}} dict of the domain
+    and the lines to be written in stats.txt.
+    With a stateDirectory the response embeddings and scores are kept there, a later run over the same
+    responses only scores the categories added or edited since, the assignment and the Novel
+    subcategories are then derived again from the scores
+    '''
+    statLines = []
+
+    categories = readCategories(domain)
+    categories.append('Novel')
+
+    #saving the scores in a rows x columns similarity matrix
+    st = time.time()
+    responseSentences = [preprocess(response) for response in responses]
+    categorySentences = [preprocess(category) for category in categories[:-1]]
+
+    state = loadDomainState(stateDirectory, domain, wordmodel, responses) if stateDirectory else None
+    if state is not None:
+        responseEmbeddings = state['embeddings']
+        previousColumns = {category: column for column, category in enumerate(state['categories'])}
+    else:
+        responseEmbeddings = sentenceEmbeddings(responseSentences, wordmodel)
+        previousColumns = {}
+
+    similarity_matrix = np.zeros((len(responses), len(categorySentences)), dtype=np.float32)
+    scoredColumns = []
+    for column, category in enumerate(categories[:-1]):
+        if category in previousColumns:
+            similarity_matrix[:, column] = state['scores'][:, previousColumns[category]]
+        else:
+            scoredColumns.append(column)
+    if scoredColumns:
+        similarity_matrix[:, scoredColumns] = similarityMatrix(
+            responseSentences, [categorySentences[column] for column in scoredColumns], wordmodel, responseEmbeddings)
+    if stateDirectory:
+        saveDomainState(stateDirectory, domain, wordmodel, responses, responseEmbeddings, categories[:-1],
+                        similarity_matrix)
+    et = time.time()
+    s = 'Similarity matrix populated in %f secs, %d of %d categories scored. ' % (
+        et-st, len(scoredColumns), len(categorySentences))
+    print(s)
+    statLines.append(s)
+
+    print('Initializing json output...')
+    domainResults = {}
+    for catName in categories:
+        domainResults[catName] = []
+
+    print('Populating category files...')
+    novelIndices = []
+    for index, (score_row, response) in enumerate(zip(similarity_matrix, responses)):
+        max_sim_index = len(categories)-1
+        if np.array(score_row).sum() > 0:
+            max_sim_index = np.array(score_row).argmax()
+        domainResults[categories[max_sim_index]].append(response)
+        if max_sim_index == len(categories)-1:
+            novelIndices.append(index)
+    print('Completed.\n')
+
+    #nearest novel response of every novel response, for their subcategorization.
+    #the responses are told apart by position, equal answers of two respondents are two responses
+    novelResponses = domainResults['Novel']
+    st = time.time()
+    novelSentences = [responseSentences[index] for index in novelIndices]
+    incidence, = incidenceMatrices(novelSentences)
+    novelPositions = list(range(len(novelResponses)))
+    neighbours = neighbourSearch.nearest(responseEmbeddings[novelIndices], incidence, novelSentences, novelPositions)
+    et = time.time()
+    s = 'Nearest novel responses for %s domain found in %f secs.' % (domain, (et-st))
+    print(s)
+    statLines.append(s)
+
+    #every novel response is linked to its most similar one, the subcategories are the connected groups
+    groups = clusterNeighbours(novelPositions, neighbours)
+    domainResults['Novel'] = {index: [novelResponses[position] for position in group]
+                              for index, group in enumerate(groups)}
+    return domainResults, statLines
+
+
+def categorizeDomainInWorker(domain, responses, neighbourSearch, stateDirectory):
+    '''
+    categorizeDomain run by a pool worker, the word model is mapped once per worker process
+    (forked workers inherit the mapping of the parent)
+    '''
+    return categorizeDomain(domain, responses, civis_embeddings(), neighbourSearch, stateDirectory)
+
+
+def categorizer(domainResponses, progress=None, workers=None, stateDirectory=None):
     '''
     driver function,
-    returns model output mapped on the input corpora as a dict object
+    returns model output mapped on the {domain: [responses]} input corpora (see csvparser.parse) as a dict object
+    stateDirectory, if given, keeps the scores of every domain for the next run (see categorizeDomain)
+    and the timings of the run in its stats.txt, they are written to the stats.txt of the working directory otherwise
+    progress, if given, is called as progress(domain, domains_done, domains_total) before each domain
+    and once more as progress('', domains_total, domains_total) at the end.
+    With workers > 1 (settings.CIVIS_WORKERS by default) the domains are categorized in parallel by a pool
+    of processes, progress is then called as the domains complete.
+    The results are ordered by domain in both cases
     '''
-    stats = open('stats.txt', 'w', encoding='utf-8')
+    if workers is None:
+        workers = settings.CIVIS_WORKERS
+
+    stats = []
+    neighbourSearch = createNeighbourSearch(settings.CIVIS_NEIGHBOURS['BACKEND'],
+                                            **settings.CIVIS_NEIGHBOURS.get('OPTIONS', {}))
 
     st = time.time()
-    wordmodelfile = 'E:/Me/IITB/Work/CIVIS/ML Approaches/word embeddings and similarity matrix/GoogleNews-vectors-negative300.bin'
-    wordmodel = KeyedVectors.load_word2vec_format(wordmodelfile, binary = True)
+    wordmodel = civis_embeddings()
     et = time.time()
     s = 'Word embedding loaded in %f secs.' % (et-st)
     print(s)
-    stats.write(s + '\n')
-
-    #filepaths
-    responsePath = './data/comments/'
-    categoryPath = './data/sentences/'
-    responseDomains = os.listdir(responsePath)
-    categoryDomains = os.listdir(categoryPath)
+    stats.append(s)
 
     #dictionary for populating the json output
     results = {}
-    for responseDomain, categoryDomain in zip(responseDomains, categoryDomains):
-        #instantiating the key for the domain
-        domain = responseDomain[:-4]
-        results[domain] = {}
-
-        print('Categorizing %s domain...' % domain)
-
-        temp = open(responsePath + responseDomain, 'r', encoding='utf-8-sig')
-        responses = temp.readlines()
-        rows = len(responses)
-
-        temp = open(categoryPath + categoryDomain, 'r', encoding='utf-8-sig')
-        categories = temp.readlines()
-        columns = len(categories)
-        categories.append('Novel')
-
-        #saving the scores in a similarity matrix
-        #initializing the matrix with -1 to catch dump/false entries
-        st = time.time()
-        similarity_matrix = [[-1 for c in range(columns)] for r in range(rows)]
-        et = time.time()
-        s = 'Similarity matrix initialized in %f secs.' % (et-st)
-        print(s)
-        stats.write(s + '\n')
-
-        row = 0
-        st = time.time()
-        for response in responses:
-            column = 0
-            for category in categories[:-1]:
-                similarity_matrix[row][column] = similarityIndex(response.split('-')[1].lstrip(), category, wordmodel)
-                column += 1
-            row += 1
-        et = time.time()
-        s = 'Similarity matrix populated in %f secs. ' % (et-st)
-        print(s)
-        stats.write(s + '\n')
-
-        print('Initializing json output...')
-        for catName in categories:
-            results[domain][catName] = []
-
-        print('Populating category files...')
-        for score_row,response in zip(similarity_matrix,responses):
-            max_sim_index = len(categories)-1
-            if np.array(score_row).sum() > 0:
-                max_sim_index = np.array(score_row).argmax()
-            results[domain][categories[max_sim_index]].append(response)
-        print('Completed.\n')
-
-        #initializing the matrix with -1 to catch dump/false entries for subcategorization of the novel responses
-        no_of_novel_responses = len(results[domain]['Novel'])
-        st = time.time()
-        similarity_matrix = [[-1 for c in range(no_of_novel_responses)] for r in range(no_of_novel_responses)]
-        et = time.time()
-        s = 'Similarity matrix for subcategorization of novel responses for %s domain initialized in %f secs.' % (domain, (et-st))
-        print(s)
-        stats.write(s + '\n')
-
-
-        #populating the matrix
-        row = 0
-        for response1 in results[domain]['Novel']:
-            column = 0
-            for response2 in results[domain]['Novel']:
-                if response1 == response2:
-                    column += 1
-                    continue
-                similarity_matrix[row][column] = similarityIndex(response1.split('-')[1].lstrip(), response2.split('-')[1].lstrip(), wordmodel)
-                column += 1
-            row += 1
-
-        setlist = []
-        index = 0
-        for score_row, response in zip(similarity_matrix, results[domain]['Novel']):
-            max_sim_index = index
-            if np.array(score_row).sum() > 0:
-                max_sim_index = np.array(score_row).argmax()
-            if set([response, results[domain]['Novel'][max_sim_index]]) not in setlist:
-                setlist.append(set([response, results[domain]['Novel'][max_sim_index]]))
-            index += 1
-
-        for i in setlist:
-            for j in setlist:
-                if i == j:
-                    continue
-                if len(i & j) > 0 and i!=j:
-                    if i & j == i:
-                        setlist = list(filter((i).__ne__, setlist))
-                        continue
-                    if i & j == j:
-                        setlist = list(filter((j).__ne__, setlist))
-                        continue
-                    setlist.append(i.union(j))
-                    if i > j:
-                        setlist = list(filter((j).__ne__, setlist))
-                    else:
-                        setlist = list(filter((i).__ne__, setlist))
-
-        novel_sub_categories = {}
-        index = 0
-        for category in setlist:
-            novel_sub_categories[index] = list(category)
-            index += 1
-
-        results[domain]['Novel'] = novel_sub_categories
-
-        print('***********************************************************')
+    domains = sorted(domainResponses)
+
+    if workers > 1 and len(domains) > 1:
+        print('Categorizing %d domains with %d processes...' % (len(domains), workers))
+        domainOutputs = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(categorizeDomainInWorker, domain, domainResponses[domain],
+                                       neighbourSearch, stateDirectory): domain
+                       for domain in domains}
+            for future in as_completed(futures):
+                domainOutputs[futures[future]] = future.result()
+                if progress:
+                    progress(futures[future], len(domainOutputs), len(domains))
+        outputs = (domainOutputs[domain] for domain in domains)
+    else:
+        def sequentialOutputs():
+            for domainIndex, domain in enumerate(domains):
+                if progress:
+                    progress(domain, domainIndex, len(domains))
+                print('Categorizing %s domain...' % domain)
+                yield categorizeDomain(domain, domainResponses[domain], wordmodel, neighbourSearch, stateDirectory)
+                print('***********************************************************')
+        outputs = sequentialOutputs()
+
+    for domain, (domainResults, statLines) in zip(domains, outputs):
+        results[domain] = domainResults
+        stats.extend(statLines)
+
+    #every job writes the stats.txt of its own file, concurrent jobs would overwrite a shared one
+    if stateDirectory:
+        os.makedirs(stateDirectory, exist_ok=True)
+    with open(os.path.join(stateDirectory or '', 'stats.txt'), 'w', encoding='utf-8') as statsFile:
+        for s in stats:
+            statsFile.write(s + '\n')
 
+    if progress:
+        progress('', len(domains), len(domains))
     return results
@@ -1,10 +1,14 @@
 
 import numpy as np
+import os
 import pickle
 
-from .SpeakupImportGraph import ImportGraph
 from django.conf import settings
 
+from Venter.ML_model.cache import model_version, normalize_lowercase, prediction_cache
+from Venter.ML_model.numpy_graph import speakup_graph
+from Venter.ML_model.utils import top_k
+
 
 class ClassificationService_speakup:
     def __init__(self):
@@ -14,7 +18,16 @@ class ClassificationService_speakup:
         self.index_complaint_title_map = {}
         for cat in self.index_complaint_title_map_r.keys():
             self.index_complaint_title_map[(self.index_complaint_title_map_r[cat])] = cat
-        self.g0 = ImportGraph.get_instance()
+        # Label of every category index
+        self.labels = np.array([self.index_complaint_title_map[i] for i in range(len(self.index_complaint_title_map))],
+                               dtype=object)
+        # The NumPy forward pass once the weights are exported, the TF graph otherwise
+        self.g0 = speakup_graph()
+        # The complaints are lowercased before their words are looked up, so case doesn't change the prediction
+        self.cache = prediction_cache(
+            model_version('speakup', os.path.join(settings.BASE_DIR, "Venter", "ML_model", "SpeakUp", "Model",
+                                                  "model.ckpt")),
+            normalize_lowercase)
 
     def get_probs_graph(self, model_id, data):
         if model_id == 0:
@@ -22,9 +35,15 @@ class ClassificationService_speakup:
         data = model.process_query(data)
         return model.run(data)
 
+    def get_probs_batch(self, texts, batch_size=256):
+        """
+        Returns the [len(texts), 14] probabilities of texts, only the texts missing from the prediction cache
+        are run through the graph
+        """
+        return self.cache.probabilities(texts, lambda batch: self.g0.run(self.g0.process_queries(batch)), batch_size)
+
     def get_top_3_cats_with_prob(self, data):
-        prob1 = self.get_probs_graph(0, data)
-        final_prob = prob1[0]
+        final_prob = self.get_probs_batch([data])[0]
         final_sorted = np.argsort(final_prob)
         final_categories = []
         final_probability = []
@@ -35,3 +54,12 @@ class ClassificationService_speakup:
         for i in range(len(final_categories)):
             result[final_categories[i]] = final_probability[i]
         return result
+
+    def get_top_k_batch(self, texts, k=3, batch_size=256):
+        """
+        Batched top k prediction, the graph is run once per chunk of batch_size texts missing from the prediction cache.
+        Returns the (indices, probabilities) arrays of shape [len(texts), k], sorted by decreasing probability.
+        """
+        if not len(texts):
+            return np.zeros((0, k), dtype=np.int64), np.zeros((0, k), dtype=np.float32)
+        return top_k(self.get_probs_batch(texts, batch_size), k)
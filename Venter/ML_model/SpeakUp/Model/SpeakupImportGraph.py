@@ -1,31 +1,32 @@
+import threading
+
 import tensorflow as tf
-import numpy as np
-from nltk.tokenize import TweetTokenizer
-import gensim
-import os
 from django.conf import settings
 
+from Venter.ML_model.embeddings import speakup_embeddings
+from Venter.ML_model.tokenizer import MeanEmbeddingEncoder
+
 
 class ImportGraph():
     instance = None
+    lock = threading.Lock()
 
     @staticmethod
     def get_instance():
         if ImportGraph.instance is None:
-            return ImportGraph(settings.BASE_DIR + "/Venter/ML_model/SpeakUp/Model/model.ckpt")
-        else:
-            return ImportGraph.instance
+            with ImportGraph.lock:
+                # Checked again, another thread may have built the graph while we were waiting for the lock
+                if ImportGraph.instance is None:
+                    ImportGraph.instance = ImportGraph(settings.BASE_DIR + "/Venter/ML_model/SpeakUp/Model/model.ckpt")
+        return ImportGraph.instance
 
     def __init__(self, path_to_model):
         g = tf.Graph()
         with g.as_default():
-            model = gensim.models.Word2Vec.load(
-                os.path.join(settings.BASE_DIR, "Venter", "ML_model", "SpeakUp", "dataset", "speakup",
-                             "word2vec_speakup_min_count_5_mix.model"))
-            self.vecs = model.wv
-            self.words = set()
-            for word, vocab_obj in self.vecs.vocab.items():
-                self.words.add(word)
+            # The word vectors are shared by every graph of the process, see Venter/ML_model/embeddings.py
+            self.vecs = speakup_embeddings()
+            self.words = self.vecs.vocab
+            self.encoder = MeanEmbeddingEncoder(self.vecs.index, self.vecs.vectors)
             embedding_dim = 300
 
             def init_weight(shape, name):
@@ -74,21 +75,10 @@ class ImportGraph():
         # The 'x' corresponds to name of input placeholder
         return self.sess.run(self.probs, feed_dict={self.X: data})
 
-    def get_clean_complaint_text_words(self, complaint_text):
-        tknzr = TweetTokenizer()
-        tokens = tknzr.tokenize(complaint_text.strip().lower())
-        complaint_text_tokens = []
-        for token in tokens:
-            if token.strip() in self.words:
-                complaint_text_tokens.append(token.strip())
-        return complaint_text_tokens
-
     def process_query(self, line):
-        tokens = self.get_clean_complaint_text_words(line)
-        vec = np.zeros(shape=300)
-        for token in tokens:
-            vec += self.vecs.word_vec(token)
-        if len(tokens) != 0:
-            vec /= len(tokens)
-        data = np.asarray(vec)
-        return [data]
+        """ Averaged word vectors of the lowercased known words of line, as a [1, 300] matrix """
+        return self.encoder.encode([line])
+
+    def process_queries(self, lines):
+        """ Averaged word vectors of every line, as one [len(lines), 300] float32 matrix """
+        return self.encoder.encode(lines)
@@ -0,0 +1,142 @@
+"""
+Prediction cache of the classification models.
+
+Complaint feeds contain many duplicate and near-identical texts, across uploads and across the users of an
+organisation. The probability vector predicted for a text is kept in an in-memory LRU and, when
+settings.PREDICTION_CACHE_SQLITE is set, in an SQLite file shared by every process, keyed by the model
+version plus the normalized text. Texts already seen never reach the TF session again.
+"""
+
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+
+def model_version(name, checkpoint_path):
+    """
+    Returns a version string for a model, changing whenever its checkpoint is retrained
+    """
+    digest = hashlib.sha1()
+    with open(checkpoint_path + '.index', 'rb') as index_file:
+        digest.update(index_file.read())
+    return '%s-%s' % (name, digest.hexdigest()[:12])
+
+
+def normalize_whitespace(text):
+    if not isinstance(text, str):
+        return ''
+    return ' '.join(text.split())
+
+
+def normalize_lowercase(text):
+    return normalize_whitespace(text).lower()
+
+
+class PredictionCache:
+    """
+    LRU cache of probability vectors with an optional SQLite tier.
+
+    normalize maps a text to its cache key, it must only drop the differences the model ignores
+    (e.g. whitespace, or case for a model lowercasing its input).
+    """
+
+    def __init__(self, version, normalize=normalize_whitespace, max_entries=100000, sqlite_path=None):
+        self.version = version
+        self.normalize = normalize
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.db = None
+        if sqlite_path:
+            self.db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self.db.execute('CREATE TABLE IF NOT EXISTS predictions (version TEXT, text TEXT, probs BLOB, '
+                            'PRIMARY KEY (version, text))')
+            self.db.commit()
+
+    def get(self, key):
+        with self.lock:
+            probs = self.entries.get(key)
+            if probs is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return probs
+
+            if self.db is not None:
+                row = self.db.execute('SELECT probs FROM predictions WHERE version = ? AND text = ?',
+                                      (self.version, key)).fetchone()
+                if row is not None:
+                    probs = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, probs)
+                    self.hits += 1
+                    return probs
+
+            self.misses += 1
+            return None
+
+    def put_many(self, keys, probs):
+        with self.lock:
+            for key, row in zip(keys, probs):
+                self._remember(key, np.asarray(row, dtype=np.float32))
+            if self.db is not None:
+                self.db.executemany('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)',
+                                    [(self.version, key, np.asarray(row, dtype=np.float32).tobytes())
+                                     for key, row in zip(keys, probs)])
+                self.db.commit()
+
+    def _remember(self, key, probs):
+        self.entries[key] = probs
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def probabilities(self, texts, predict, batch_size=256):
+        """
+        Returns the [len(texts), n_categories] probabilities of texts,
+        predict(list of normalized texts) is only called for the texts missing from the cache,
+        batch_size of them at a time and every distinct text only once.
+        """
+        keys = [self.normalize(text) for text in texts]
+        rows = [None] * len(keys)
+        missing = OrderedDict()
+        for position, key in enumerate(keys):
+            if key in missing:
+                missing[key].append(position)
+                continue
+            probs = self.get(key)
+            if probs is None:
+                missing[key] = [position]
+            else:
+                rows[position] = probs
+
+        missing_keys = list(missing)
+        for start in range(0, len(missing_keys), batch_size):
+            batch = missing_keys[start:start + batch_size]
+            probs = predict(batch)
+            self.put_many(batch, probs)
+            for key, row in zip(batch, probs):
+                for position in missing[key]:
+                    rows[position] = row
+
+        return np.array(rows, dtype=np.float32)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
+
+    def __str__(self):
+        return '%s: %d hits, %d misses, %d entries in memory' % (self.version, self.hits, self.misses,
+                                                                 len(self.entries))
+
+
+def prediction_cache(version, normalize=normalize_whitespace):
+    """
+    Returns a PredictionCache configured by settings.PREDICTION_CACHE_SIZE and settings.PREDICTION_CACHE_SQLITE
+    """
+    return PredictionCache(version, normalize, max_entries=settings.PREDICTION_CACHE_SIZE,
+                           sqlite_path=settings.PREDICTION_CACHE_SQLITE)
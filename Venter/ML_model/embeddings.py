@@ -0,0 +1,219 @@
+"""
+Word embedding arrays used by the classification models.
+
+The arrays are loaded once per process and kept here, the TF graphs only receive the looked up vectors.
+
+Once `python manage.py convert_embeddings` has been run, the matrices are opened from float32 .npy files
+with np.load(mmap_mode='r') instead: startup only maps the files and every process shares them
+through the page cache.
+
+The Civis model uses a reduced copy of the GoogleNews word2vec model (settings.CIVIS_WORDMODEL):
+the most frequent words plus the words of the category files and of the past uploads, built by
+`python manage.py build_civis_vocabulary` into settings.CIVIS_WORDMODEL_STORE. The vectors are kept raw,
+the sentence embeddings are the means of the raw vectors as in the n_similarity of gensim.
+"""
+
+import json
+import os
+import pickle
+import threading
+
+import numpy as np
+from django.conf import settings
+
+MCGM_CHECKPOINT = os.path.join(settings.BASE_DIR, "Venter", "ML_model", "model", "model.ckpt")
+MCGM_WORD_INDEX_MAP = os.path.join(settings.BASE_DIR, "Venter", "ML_model", "dataset", "dataset_mcgm_clean",
+                                   "word_index_map_mcgm.pickle")
+MCGM_STORE = os.path.join(settings.BASE_DIR, "Venter", "ML_model", "dataset", "dataset_mcgm_clean",
+                          "word_embedding_mcgm")
+SPEAKUP_WORD2VEC = os.path.join(settings.BASE_DIR, "Venter", "ML_model", "SpeakUp", "dataset", "speakup",
+                                "word2vec_speakup_min_count_5_mix.model")
+SPEAKUP_STORE = os.path.join(settings.BASE_DIR, "Venter", "ML_model", "SpeakUp", "dataset", "speakup",
+                             "word2vec_speakup_min_count_5_mix")
+
+CIVIS_WORDMODEL = settings.CIVIS_WORDMODEL
+CIVIS_STORE = settings.CIVIS_WORDMODEL_STORE
+
+_cache = {}
+_lock = threading.Lock()
+
+
+class EmbeddingStore:
+    """
+    A [vocab_size, dim] float32 matrix and its word -> row index, saved as <path>.npy and <path>.vocab.json.
+
+    It answers the subset of the gensim KeyedVectors interface used by the models
+    (vocab, word_vec(), [] and in), so it can stand in for them.
+    """
+
+    def __init__(self, vectors, index, version=None):
+        self.vectors = vectors
+        self.index = index
+        # Identifies the saved matrix, None for a store built in memory
+        self.version = version
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(path + '.npy') and os.path.exists(path + '.vocab.json')
+
+    @staticmethod
+    def save(path, vectors, index):
+        # Written aside and renamed over the store, the processes still mapping the previous file keep reading it
+        with open(path + '.npy.tmp', 'wb') as vectors_file:
+            np.save(vectors_file, np.ascontiguousarray(vectors, dtype=np.float32))
+        with open(path + '.vocab.json.tmp', 'w', encoding='utf-8') as vocab_file:
+            json.dump(index, vocab_file, ensure_ascii=False)
+        os.replace(path + '.npy.tmp', path + '.npy')
+        os.replace(path + '.vocab.json.tmp', path + '.vocab.json')
+
+    @staticmethod
+    def load(path):
+        vectors = np.load(path + '.npy', mmap_mode='r')
+        with open(path + '.vocab.json', encoding='utf-8') as vocab_file:
+            index = json.load(vocab_file)
+        stat = os.stat(path + '.npy')
+        return EmbeddingStore(vectors, index, '%d-%d' % (stat.st_size, stat.st_mtime_ns))
+
+    @property
+    def vocab(self):
+        return self.index
+
+    @property
+    def vector_size(self):
+        return self.vectors.shape[1]
+
+    def word_vec(self, word):
+        return self.vectors[self.index[word]]
+
+    def __getitem__(self, word):
+        return self.word_vec(word)
+
+    def __contains__(self, word):
+        return word in self.index
+
+    def __len__(self):
+        return len(self.vectors)
+
+
+def _cached(name, loader):
+    if name not in _cache:
+        with _lock:
+            if name not in _cache:
+                _cache[name] = loader()
+    return _cache[name]
+
+
+def read_mcgm():
+    """
+    Reads (word_index_map, word_vectors) of the MCGM model from the pickle and the checkpoint
+    """
+    with open(MCGM_WORD_INDEX_MAP, "rb") as myFile:
+        word_index_map = pickle.load(myFile, encoding='latin1')
+
+    # Only needed to read the checkpoint, the Civis model uses EmbeddingStore without tensorflow
+    import tensorflow as tf
+
+    # The word embedding is fine tuned during training, so the vectors used by the model are
+    # the ones saved in the checkpoint and not the initial word_vectors_mcgm.pickle
+    reader = tf.train.NewCheckpointReader(MCGM_CHECKPOINT)
+    word_vectors = np.ascontiguousarray(reader.get_tensor('word_embedding'), dtype=np.float32)
+    return word_index_map, word_vectors
+
+
+def read_speakup():
+    """
+    Reads the SpeakUp word2vec model and returns its (word -> row index, float32 vectors)
+    """
+    # Only needed to read the word2vec model, once converted the store is read without gensim
+    import gensim
+
+    # Only the KeyedVectors are kept, the training weights of the full Word2Vec model are dropped
+    vecs = gensim.models.Word2Vec.load(SPEAKUP_WORD2VEC).wv
+    index = {word: vocab_obj.index for word, vocab_obj in vecs.vocab.items()}
+    return index, np.asarray(vecs.vectors, dtype=np.float32)
+
+
+def read_word2vec_binary(path, keep):
+    """
+    Streams a word2vec binary file, returning (word -> row index, float32 vectors) of the words for which
+    keep(rank, word) is true, rank being the position of the word in the file (by decreasing frequency).
+    Only the kept vectors are held in memory.
+    """
+    index = {}
+    vectors = []
+    with open(path, 'rb') as word2vec_file:
+        vocab_size, dim = map(int, word2vec_file.readline().split())
+        vector_bytes = np.dtype(np.float32).itemsize * dim
+        for rank in range(vocab_size):
+            word = bytearray()
+            while True:
+                character = word2vec_file.read(1)
+                if character == b' ' or not character:
+                    break
+                if character != b'\n':
+                    word.extend(character)
+            vector = word2vec_file.read(vector_bytes)
+            word = word.decode('utf-8', errors='ignore')
+            if keep(rank, word) and word not in index:
+                index[word] = len(vectors)
+                vectors.append(np.frombuffer(vector, dtype=np.float32))
+    return index, np.array(vectors, dtype=np.float32).reshape(len(vectors), dim)
+
+
+def read_civis(vocab_size, extra_words=()):
+    """
+    Reads the vocab_size most frequent words of the Civis word2vec model plus extra_words,
+    returns (word -> row index, float32 vectors)
+    """
+    extra_words = set(extra_words)
+    return read_word2vec_binary(CIVIS_WORDMODEL, lambda rank, word: rank < vocab_size or word in extra_words)
+
+
+def _load_mcgm():
+    if EmbeddingStore.exists(MCGM_STORE):
+        store = EmbeddingStore.load(MCGM_STORE)
+        return store.index, store.vectors
+    print('%s.npy not found, reading the checkpoint (run manage.py convert_embeddings once).' % MCGM_STORE)
+    return read_mcgm()
+
+
+def _load_speakup():
+    if EmbeddingStore.exists(SPEAKUP_STORE):
+        return EmbeddingStore.load(SPEAKUP_STORE)
+    print('%s.npy not found, reading the word2vec model (run manage.py convert_embeddings once).' % SPEAKUP_STORE)
+    index, vectors = read_speakup()
+    return EmbeddingStore(vectors, index)
+
+
+def _load_civis():
+    if not EmbeddingStore.exists(CIVIS_STORE):
+        # Imported here, the Civis package depends on this module
+        from Venter.ML_model.Civis.sentencemodel import categoryWords
+
+        print('%s.npy not found, building it without the words of the past uploads '
+              '(run manage.py build_civis_vocabulary once).' % CIVIS_STORE)
+        index, vectors = read_civis(settings.CIVIS_WORDMODEL_VOCAB_SIZE, categoryWords())
+        EmbeddingStore.save(CIVIS_STORE, vectors, index)
+    return EmbeddingStore.load(CIVIS_STORE)
+
+
+def mcgm_embeddings():
+    """
+    Returns (word_index_map, word_vectors) of the MCGM model, word_vectors being a float32 [vocab_size, 300] array
+    """
+    return _cached('mcgm', _load_mcgm)
+
+
+def speakup_embeddings():
+    """
+    Returns the EmbeddingStore of the SpeakUp word2vec model
+    """
+    return _cached('speakup', _load_speakup)
+
+
+def civis_embeddings():
+    """
+    Returns the EmbeddingStore of the reduced Civis word model
+    """
+    return _cached('civis', _load_civis)
+
@@ -1,9 +1,18 @@
 import numpy as np
 import pandas as pd
-from .ImportGraph import ImportGraph
 import os
 from django.conf import settings
 
+from Venter.ML_model.cache import model_version, normalize_whitespace, prediction_cache
+from Venter.ML_model.numpy_graph import mcgm_graph
+from Venter.ML_model.utils import top_k
+
+# Categories of complaint_categories.csv which only have a marathi name
+MARATHI_TRANSLATIONS = {
+    'मॅनहोलमध्ये व्यक्ती पडणे': 'Person falling in Manhole',
+    'थकबाकी येणे बाकी': 'Outstanding dues pending',
+}
+
 
 class ClassificationService:
     def __init__(self):
@@ -22,7 +31,16 @@ class ClassificationService:
             line = line.strip('\'').replace("/", " ").replace("(", " ").replace(")", " ")
             self.index_complaint_title_map[i] = line
 
-        self.g0 = ImportGraph.get_instance()
+        # Label of every category index, with the marathi only categories translated to english
+        titles = [self.index_complaint_title_map[i] for i in range(len(complaints))]
+        self.labels = np.array([MARATHI_TRANSLATIONS.get(title, title) for title in titles], dtype=object)
+
+        # The NumPy forward pass once the weights are exported, the TF graph otherwise
+        self.g0 = mcgm_graph()
+        # The tokenizer ignores whitespace but the vocabulary is case sensitive
+        self.cache = prediction_cache(
+            model_version('mcgm', os.path.join(settings.BASE_DIR, "Venter", "ML_model", "model", "model.ckpt")),
+            normalize_whitespace)
 
     def get_probs_graph(self, model_id, data, flag):
         if model_id == 0:
@@ -31,10 +49,16 @@ class ClassificationService:
         data = model.process_query(data, flag)
         return model.run(data)
 
-    def get_top_3_cats_with_prob(self, data):
-        prob1 = self.get_probs_graph(0, data, flag=1)
+    def get_probs_batch(self, texts, batch_size=256):
+        """
+        Returns the [len(texts), 165] probabilities of texts, only the texts missing from the prediction cache
+        are run through the graph, batch_size of them at a time.
+        """
+        return self.cache.probabilities(
+            texts, lambda batch: self.g0.run(self.g0.process_queries(batch, flag=1)), batch_size)
 
-        final_prob = prob1[0]  # + prob2 + prob3 + prob4 + prob5 + prob6 + prob7
+    def get_top_3_cats_with_prob(self, data):
+        final_prob = self.get_probs_batch([data])[0]  # + prob2 + prob3 + prob4 + prob5 + prob6 + prob7
 
         final_sorted = np.argsort(final_prob)
 
@@ -50,3 +74,30 @@ class ClassificationService:
         for i in range(len(final_categories)):
             result[final_categories[i]] = final_probability[i]
         return result
+
+    def get_top_k_batch(self, texts, k=3, batch_size=256):
+        """
+        Batched top k prediction.
+        The texts missing from the prediction cache are encoded into index matrices and the graph is run
+        on chunks of batch_size rows, so a whole csv column costs at most len(texts) / batch_size session calls
+        instead of one per complaint.
+        Returns the (indices, probabilities) arrays of shape [len(texts), k], sorted by decreasing probability.
+        """
+        if not len(texts):
+            return np.zeros((0, k), dtype=np.int64), np.zeros((0, k), dtype=np.float32)
+        return top_k(self.get_probs_batch(texts, batch_size), k)
+
+    def get_top_k_cats_batch(self, texts, k=3, batch_size=256):
+        """
+        Batched version of get_top_3_cats_with_prob(),
+        returns one {category: probability} dict per text, ordered by decreasing probability.
+        The categories are the labels, with the marathi only categories translated as in the csv predictions.
+        """
+        indices, probs = self.get_top_k_batch(texts, k, batch_size)
+        results = []
+        for row_indices, row_probs in zip(indices, probs):
+            result = {}
+            for index, prob in zip(row_indices, row_probs):
+                result[self.labels[index]] = float(prob)
+            results.append(result)
+        return results
@@ -1,20 +1,25 @@
+import threading
+
 import tensorflow as tf
-import pickle
 import numpy as np
-from numpy import linalg as la
-from nltk.tokenize import TweetTokenizer
 from django.conf import settings
 
+from Venter.ML_model.embeddings import mcgm_embeddings
+from Venter.ML_model.tokenizer import QueryEncoder
+
 
 class ImportGraph:
     instance = None
+    lock = threading.Lock()
 
     @staticmethod
     def get_instance():
         if ImportGraph.instance is None:
-            return ImportGraph(settings.BASE_DIR + "/Venter/ML_model/model/" + 'model.ckpt')
-        else:
-            return ImportGraph.instance
+            with ImportGraph.lock:
+                # Checked again, another thread may have built the graph while we were waiting for the lock
+                if ImportGraph.instance is None:
+                    ImportGraph.instance = ImportGraph(settings.BASE_DIR + "/Venter/ML_model/model/" + 'model.ckpt')
+        return ImportGraph.instance
 
     def init_weight(self, shape, name):
         initial = tf.truncated_normal(shape, stddev=0.1, name=name, dtype=tf.float32)
@@ -25,30 +30,14 @@ class ImportGraph:
         return tf.Variable(initial)
 
     def __init__(self, path_to_model):
-        global word_vectors
         g = tf.Graph()
         with g.as_default():
             train_attention = True
-            initialize_random = False
-            train_we = True
-
-            with open(settings.BASE_DIR + str(
-                    "/Venter/ML_model/dataset/dataset_mcgm_clean/word_index_map_mcgm.pickle"), "rb") as myFile:
-                self.word_index_map = pickle.load(myFile, encoding='latin1')
-
-            if not initialize_random:
 
-                # load pre-trained word embedding.
-                with open(settings.BASE_DIR + "/Venter/ML_model/dataset/dataset_mcgm_clean/word_vectors_mcgm.pickle",
-                          "rb") as myFile:
-                    word_vectors = pickle.load(myFile, encoding='latin1')
+            # The vocabulary and the (trained) word embedding are shared by every graph of the process,
+            # see Venter/ML_model/embeddings.py
+            self.word_index_map, self.word_vectors = mcgm_embeddings()
 
-                word_vectors = np.asarray(word_vectors).astype(np.float32)
-
-                for i in range(len(word_vectors) - 1):
-                    word_vectors[i] /= (la.norm((word_vectors[i])))
-
-            vocab_size = len(word_vectors)
             embedding_dim = 300
             # learning_rate = 1e-3
             # decay_factor = 0.99
@@ -56,7 +45,8 @@ class ImportGraph:
             # batch_size = 100
             # iterations = 200
             # highest_val_acc = 0
-            self.last_index = len(word_vectors) - 1
+            self.last_index = len(self.word_vectors) - 1
+            self.encoder = QueryEncoder(self.word_index_map, self.max_padded_sentence_length, self.last_index)
 
             def init_weight(shape, name):
                 initial = tf.truncated_normal(shape, stddev=0.1, name=name, dtype=tf.float32)
@@ -66,25 +56,11 @@ class ImportGraph:
                 initial = tf.truncated_normal(shape=shape, stddev=0.1, name=name, dtype=tf.float32)
                 return tf.Variable(initial)
 
-            if initialize_random:
-
-                # Initial embedding initialized randomly
-                embedding_init = tf.Variable(
-                    tf.truncated_normal(shape=[vocab_size, embedding_dim], stddev=0.1, dtype=tf.float32),
-                    trainable=train_we, name="word_embedding")
-
-            else:
-
-                # Initial embedding initialized by word2vec vectors
-                embedding_init = tf.Variable(tf.constant(word_vectors, shape=[vocab_size, embedding_dim]),
-                                             trainable=train_we, name="word_embedding")
-
-            # config = projector.ProjectorConfig()
-            # It will hold tensor of size [batch_size, max_padded_sentence_length]
-            self.X = tf.placeholder(tf.int32, [None, self.max_padded_sentence_length])
-
-            # Word embedding lookup
-            word_embeddings = tf.nn.embedding_lookup(embedding_init, self.X)
+            # The word embedding lookup is done in numpy by run() on the shared word_vectors array,
+            # so that the graph doesn't hold its own copy of the [vocab_size, 300] matrix.
+            # It will hold tensor of size [batch_size, max_padded_sentence_length, embedding_dim]
+            self.X = tf.placeholder(tf.float32, [None, self.max_padded_sentence_length, embedding_dim])
+            word_embeddings = self.X
 
             if train_attention:
 
@@ -164,29 +140,22 @@ class ImportGraph:
             saver.restore(self.sess, path_to_model)
 
     def run(self, data):
-        """ Running the activation operation previously imported """
-        # The 'x' corresponds to name of input placeholder
-        return self.sess.run(self.probs, feed_dict={self.X: data})
+        """
+        Running the activation operation previously imported on a [batch_size, max_padded_sentence_length]
+        index matrix
+        """
+        # The 'x' corresponds to name of input placeholder, it takes the looked up word vectors
+        return self.sess.run(self.probs, feed_dict={self.X: self.word_vectors[np.asarray(data)]})
 
     def process_query(self, line, flag):
-
-        if flag == 1:
-            tokens = TweetTokenizer().tokenize(line.strip())
-        else:
-            tokens = line.strip().split()
-        indices = []
-        clean_words = []
-        for token in tokens:
-            if token.strip() in self.word_index_map.keys():
-                indices.append(self.word_index_map[token.strip()])
-                clean_words.append(token.strip())
-        if len(indices) < 100:
-            indices += [self.last_index] * (self.max_padded_sentence_length - len(indices))
-        else:
-            return ""
-        indices = np.asarray(indices)
-        data = []
-        data.append(indices)
-        data = np.asarray(data)
-
-        return data
+        """ Encodes one query into a [1, max_padded_sentence_length] index matrix, see process_queries() """
+        return self.encoder.encode([line], flag)
+
+    def process_queries(self, lines, flag):
+        """
+        Encodes a list of queries into a single padded index matrix of shape
+        [len(lines), max_padded_sentence_length] which can be fed to run() in one go.
+        Queries longer than max_padded_sentence_length known tokens are truncated,
+        anything that is not a string is treated as an empty query.
+        """
+        return self.encoder.encode(lines, flag)
@@ -0,0 +1,180 @@
+"""
+NumPy forward pass of the MCGM and SpeakUp classification graphs.
+
+The TF graphs of ImportGraph only run a few dense layers, the attention softmax of MCGM and a softmax.
+Once `python manage.py export_numpy_weights` has dumped the restored checkpoint variables into .npz files,
+the classification services run the same layers with NumPy and the workers never import tensorflow.
+The word vectors are not part of the .npz files, they are the (memory-mapped) arrays of embeddings.py.
+
+This python file can be imported and contains the following
+functions:
+    1) read_mcgm_weights - returns the dense layers of the MCGM checkpoint, named as in ImportGraph
+    2) read_speakup_weights - returns the dense layers of the SpeakUp checkpoint, named as in SpeakupImportGraph
+    3) save_weights, load_weights - write and read the exported .npz files
+    4) relu, softmax - the activations of the graphs
+    5) mcgm_graph, speakup_graph - return the NumPy graph of a model, or its TF graph when the weights aren't exported
+
+and the MCGMNumpyGraph and SpeakupNumpyGraph classes, which answer the run(), process_query() and
+process_queries() of the TF graphs.
+"""
+
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from Venter.ML_model.embeddings import mcgm_embeddings, speakup_embeddings
+from Venter.ML_model.tokenizer import MeanEmbeddingEncoder, QueryEncoder
+
+MCGM_CHECKPOINT = os.path.join(settings.BASE_DIR, "Venter", "ML_model", "model", "model.ckpt")
+MCGM_WEIGHTS = os.path.join(settings.BASE_DIR, "Venter", "ML_model", "model", "model_weights.npz")
+SPEAKUP_CHECKPOINT = os.path.join(settings.BASE_DIR, "Venter", "ML_model", "SpeakUp", "Model", "model.ckpt")
+SPEAKUP_WEIGHTS = os.path.join(settings.BASE_DIR, "Venter", "ML_model", "SpeakUp", "Model", "model_weights.npz")
+
+# The graphs create their variables without a name, tensorflow names them Variable, Variable_1, ...
+# in creation order and the Saver restores them by these names
+MCGM_VARIABLES = ['Wa', 'ba', 'Wa1', 'ba1', 'Wa2', 'ba2', 'W', 'b', 'W1', 'b1', 'W2', 'b2']
+SPEAKUP_VARIABLES = ['W1', 'b1', 'W2', 'b2']
+
+
+def read_checkpoint_variables(path, names):
+    """
+    Returns {name: float32 array} of the unnamed variables of the checkpoint at path, names being in creation order
+    """
+    # Only needed for the export, the NumPy graphs never import tensorflow
+    import tensorflow as tf
+
+    reader = tf.train.NewCheckpointReader(path)
+    return {
+        name: np.asarray(reader.get_tensor('Variable' if rank == 0 else 'Variable_%d' % rank), dtype=np.float32)
+        for rank, name in enumerate(names)
+    }
+
+
+def read_mcgm_weights():
+    return read_checkpoint_variables(MCGM_CHECKPOINT, MCGM_VARIABLES)
+
+
+def read_speakup_weights():
+    return read_checkpoint_variables(SPEAKUP_CHECKPOINT, SPEAKUP_VARIABLES)
+
+
+def save_weights(path, weights):
+    # Written aside and renamed, a worker starting meanwhile never opens a partial file
+    with open(path + '.tmp', 'wb') as weights_file:
+        np.savez(weights_file, **weights)
+    os.replace(path + '.tmp', path)
+
+
+def load_weights(path):
+    with np.load(path) as weights:
+        return {name: np.ascontiguousarray(weights[name], dtype=np.float32) for name in weights.files}
+
+
+def relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def softmax(x, axis=-1):
+    x = x - x.max(axis=axis, keepdims=True)
+    np.exp(x, out=x)
+    x /= x.sum(axis=axis, keepdims=True)
+    return x
+
+
+class MCGMNumpyGraph:
+    instance = None
+    lock = threading.Lock()
+
+    @staticmethod
+    def get_instance():
+        if MCGMNumpyGraph.instance is None:
+            with MCGMNumpyGraph.lock:
+                if MCGMNumpyGraph.instance is None:
+                    word_index_map, word_vectors = mcgm_embeddings()
+                    MCGMNumpyGraph.instance = MCGMNumpyGraph(load_weights(MCGM_WEIGHTS), word_index_map, word_vectors)
+        return MCGMNumpyGraph.instance
+
+    def __init__(self, weights, word_index_map, word_vectors):
+        self.weights = weights
+        self.word_index_map, self.word_vectors = word_index_map, word_vectors
+        self.max_padded_sentence_length = 35
+        self.last_index = len(self.word_vectors) - 1
+        self.encoder = QueryEncoder(self.word_index_map, self.max_padded_sentence_length, self.last_index)
+
+    def run(self, data):
+        """ Forward pass of ImportGraph on a [batch_size, max_padded_sentence_length] index matrix """
+        w = self.weights
+        word_embeddings = np.asarray(self.word_vectors[np.asarray(data)], dtype=np.float32)
+        batch_size, length, embedding_dim = word_embeddings.shape
+
+        # Attention over the words of every sentence
+        ya = relu(word_embeddings.reshape(batch_size * length, embedding_dim).dot(w['Wa']) + w['ba'])
+        ya1 = relu(ya.dot(w['Wa1']) + w['ba1'])
+        ya2 = ya1.dot(w['Wa2']) + w['ba2']
+        attention = softmax(ya2.reshape(batch_size, length), axis=1)
+        sentence_embedding = np.einsum('bld,bl->bd', word_embeddings, attention)
+
+        y = relu(sentence_embedding.dot(w['W']) + w['b'])
+        y1 = relu(y.dot(w['W1']) + w['b1'])
+        return softmax(y1.dot(w['W2']) + w['b2'])
+
+    def process_query(self, line, flag):
+        return self.encoder.encode([line], flag)
+
+    def process_queries(self, lines, flag):
+        return self.encoder.encode(lines, flag)
+
+
+class SpeakupNumpyGraph:
+    instance = None
+    lock = threading.Lock()
+
+    @staticmethod
+    def get_instance():
+        if SpeakupNumpyGraph.instance is None:
+            with SpeakupNumpyGraph.lock:
+                if SpeakupNumpyGraph.instance is None:
+                    SpeakupNumpyGraph.instance = SpeakupNumpyGraph(load_weights(SPEAKUP_WEIGHTS), speakup_embeddings())
+        return SpeakupNumpyGraph.instance
+
+    def __init__(self, weights, vecs):
+        self.weights = weights
+        self.vecs = vecs
+        self.words = self.vecs.vocab
+        self.encoder = MeanEmbeddingEncoder(self.vecs.index, self.vecs.vectors)
+
+    def run(self, data):
+        """ Forward pass of SpeakupImportGraph on a [batch_size, 300] matrix of averaged word vectors """
+        w = self.weights
+        y1 = relu(np.asarray(data, dtype=np.float32).dot(w['W1']) + w['b1'])
+        return softmax(y1.dot(w['W2']) + w['b2'])
+
+    def process_query(self, line):
+        return self.encoder.encode([line])
+
+    def process_queries(self, lines):
+        return self.encoder.encode(lines)
+
+
+def mcgm_graph():
+    """
+    Returns the shared graph of the MCGM model, the NumPy one once its weights are exported
+    """
+    if os.path.exists(MCGM_WEIGHTS):
+        return MCGMNumpyGraph.get_instance()
+    print('%s not found, building the TensorFlow graph (run manage.py export_numpy_weights once).' % MCGM_WEIGHTS)
+    from Venter.ML_model.model.ImportGraph import ImportGraph
+    return ImportGraph.get_instance()
+
+
+def speakup_graph():
+    """
+    Returns the shared graph of the SpeakUp model, the NumPy one once its weights are exported
+    """
+    if os.path.exists(SPEAKUP_WEIGHTS):
+        return SpeakupNumpyGraph.get_instance()
+    print('%s not found, building the TensorFlow graph (run manage.py export_numpy_weights once).' % SPEAKUP_WEIGHTS)
+    from Venter.ML_model.SpeakUp.Model.SpeakupImportGraph import ImportGraph
+    return ImportGraph.get_instance()
@@ -0,0 +1,95 @@
+"""
+Process wide registry of the classification models.
+
+Every model listed in settings.ML_MODELS is loaded at most once per process (i.e. once per uWSGI worker)
+and the same instance is then shared by every request and every thread of that process.
+The load time and the growth of the resident memory caused by each load are recorded in ModelRegistry.stats.
+
+Usage:
+    from Venter.ML_model.registry import get_model
+    cs = get_model('ICMC')
+    cs.get_top_3_cats_with_prob(complaint_title)
+"""
+
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+def resident_memory():
+    """
+    Returns the resident set size of the current process in bytes, None where /proc is not available
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+class ModelRegistry:
+    """
+    Thread-safe, lazily populated map of model name -> loaded model instance.
+
+    The models are constructed from the dotted class paths of settings.ML_MODELS,
+    a lock per model name makes sure that two threads asking for the same model don't load it twice
+    while a slow load of one model doesn't block the lookups of the others.
+    """
+
+    def __init__(self):
+        self.models = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.model_locks = {}
+
+    def get(self, name):
+        model = self.models.get(name)
+        if model is not None:
+            return model
+
+        with self.lock:
+            model_lock = self.model_locks.setdefault(name, threading.Lock())
+
+        with model_lock:
+            # Another thread may have loaded the model while we were waiting for the lock
+            if name not in self.models:
+                self.models[name] = self.load(name)
+        return self.models[name]
+
+    def load(self, name):
+        if name not in settings.ML_MODELS:
+            raise KeyError("No model is registered for '%s'" % name)
+
+        memory_before = resident_memory()
+        start = time.time()
+        model = import_string(settings.ML_MODELS[name])()
+        load_time = time.time() - start
+        memory_after = resident_memory()
+
+        memory = None
+        if memory_before is not None and memory_after is not None:
+            memory = memory_after - memory_before
+        self.stats[name] = {'load_time': load_time, 'memory': memory, 'pid': os.getpid()}
+
+        if memory is None:
+            print('Model %s loaded in %f secs.' % (name, load_time))
+        else:
+            print('Model %s loaded in %f secs, resident memory grew by %.1f MB.' % (
+                name, load_time, memory / (1024 * 1024)))
+        return model
+
+    def is_loaded(self, name):
+        return name in self.models
+
+
+registry = ModelRegistry()
+
+
+def get_model(name):
+    """
+    Returns the shared instance of the model registered under name in settings.ML_MODELS
+    """
+    return registry.get(name)
@@ -0,0 +1,90 @@
+"""Tokenization and index encoding of the complaints fed to the classification models.
+
+The TweetTokenizer only holds compiled regular expressions, a single instance is shared by the process
+instead of one being built per complaint.
+
+This python file can be imported and contains the following
+functions:
+    1) tokenize - splits a complaint into its tokens
+
+and the classes
+    1) QueryEncoder - encodes complaints into the padded index matrices of the MCGM graph
+    2) MeanEmbeddingEncoder - encodes complaints into the averaged word vectors of the SpeakUp graph
+"""
+
+import numpy as np
+from nltk.tokenize import TweetTokenizer
+
+tweet_tokenizer = TweetTokenizer()
+
+
+def tokenize(line, flag=1, lower=False):
+    """
+    Returns the tokens of line, split by the TweetTokenizer if flag is 1 and on whitespace otherwise
+    """
+    if lower:
+        line = line.lower()
+    if flag == 1:
+        return tweet_tokenizer.tokenize(line.strip())
+    return line.split()
+
+
+class QueryEncoder:
+    """
+    Encodes complaints into [len(lines), max_length] int32 matrices of word indices.
+    The tokens missing from word_index_map are skipped, the known ones after the first max_length are dropped
+    and the rows are padded with pad_index.
+    """
+
+    def __init__(self, word_index_map, max_length, pad_index):
+        self.word_index_map = word_index_map
+        self.max_length = max_length
+        self.pad_index = pad_index
+
+    def encode(self, lines, flag=1):
+        """
+        Returns the index matrix of lines, anything that is not a string is encoded as an empty complaint
+        """
+        data = np.full((len(lines), self.max_length), self.pad_index, dtype=np.int32)
+        lookup = self.word_index_map.get
+        for row, line in enumerate(lines):
+            if not isinstance(line, str):
+                continue
+            indices = [index for index in map(lookup, tokenize(line, flag)) if index is not None][:self.max_length]
+            data[row, :len(indices)] = indices
+        return data
+
+
+class MeanEmbeddingEncoder:
+    """
+    Encodes complaints into the [len(lines), dim] float32 means of the vectors of their lowercased known words,
+    a complaint without any known word gets a zero row.
+
+    The indices of the words of all the complaints are gathered at once and summed per complaint
+    with np.add.reduceat, instead of adding the vectors one word at a time.
+    """
+
+    def __init__(self, word_index_map, vectors):
+        self.word_index_map = word_index_map
+        self.vectors = vectors
+
+    def encode(self, lines):
+        lookup = self.word_index_map.get
+        indices = []
+        lengths = np.zeros(len(lines), dtype=np.int64)
+        for row, line in enumerate(lines):
+            if not isinstance(line, str):
+                continue
+            known = [index for index in map(lookup, tokenize(line, lower=True)) if index is not None]
+            indices.extend(known)
+            lengths[row] = len(known)
+
+        data = np.zeros((len(lines), self.vectors.shape[1]), dtype=np.float32)
+        rows = np.flatnonzero(lengths)
+        if len(rows):
+            # reduceat sums the words from each start to the next one, only the complaints with words are given
+            # a start as an empty segment would get the vector at its start instead of zeros
+            starts = np.concatenate(([0], np.cumsum(lengths[rows])[:-1]))
+            gathered = np.asarray(self.vectors[np.asarray(indices)], dtype=np.float32)
+            data[rows] = np.add.reduceat(gathered, starts, axis=0) / lengths[rows, None].astype(np.float32)
+        return data
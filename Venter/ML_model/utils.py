@@ -0,0 +1,15 @@
+"""Helper functions shared by the classification models."""
+
+import numpy as np
+
+
+def top_k(probs, k):
+    """
+    Returns the (indices, probabilities) arrays of the k most probable categories of every row of probs,
+    both of shape [len(probs), k] and sorted by decreasing probability
+    """
+    rows = np.arange(len(probs))[:, None]
+    # argpartition only guarantees the k largest are in the last k slots, sort those k afterwards
+    indices = np.argpartition(probs, -k, axis=1)[:, -k:]
+    indices = indices[rows, np.argsort(-probs[rows, indices], axis=1)]
+    return indices, probs[rows, indices]
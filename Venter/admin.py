@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from Venter.models import Category, File, Header, Organisation, Profile
+from Venter.models import Category, File, Header, Organisation, PredictionJob, Profile
 
 
 class HeaderAdmin(admin.ModelAdmin):
@@ -15,6 +15,10 @@ class FileAdmin(admin.ModelAdmin):
     list_display = ('uploaded_by', 'uploaded_date')
     list_filter = ['uploaded_date']
 
+class PredictionJobAdmin(admin.ModelAdmin):
+    list_display = ('file', 'state', 'domains_done', 'domains_total', 'created_date', 'finished_date')
+    list_filter = ['state']
+
 class ProfileAdmin(admin.ModelAdmin):
     verbose_name_plural = 'Employee Details'
     list_display = ('user', 'organisation_name', 'phone_number')
@@ -26,5 +30,6 @@ class OrganisationAdmin(admin.ModelAdmin):
 admin.site.register(Header, HeaderAdmin)
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(File, FileAdmin)
+admin.site.register(PredictionJob, PredictionJobAdmin)
 admin.site.register(Profile, ProfileAdmin)
 admin.site.register(Organisation, OrganisationAdmin)
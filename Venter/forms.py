@@ -42,7 +42,7 @@ class CSVForm(forms.ModelForm):
         # checks for non-null file upload
         if uploaded_input_file:
             # validation of the filetype based on the extension type .csv
-            # validation of the filesize based on the size limit 5MB
+            # validation of the filesize based on the size limit settings.MAX_UPLOAD_SIZE
             # the input_file_header_validation() is invoked from validate.py
             filename = uploaded_input_file.name
             if filename.endswith(settings.FILE_UPLOAD_TYPE):
@@ -54,7 +54,7 @@ class CSVForm(forms.ModelForm):
                             "Incorrect headers detected, please upload correct file")
                 else:
                     raise forms.ValidationError(
-                        "File size must not exceed 5 MB")
+                        "File size must not exceed %d MB" % (int(settings.MAX_UPLOAD_SIZE) // (1024 * 1024)))
             else:
                 raise forms.ValidationError(
                     "Please upload .csv extension files only")
@@ -2,6 +2,8 @@
 
 import os
 
+from django.conf import settings
+
 def get_file_upload_path(instance, filename):
     """
     Returns a custom MEDIA path for files uploaded by a user
@@ -33,3 +35,10 @@ def get_result_file_path(instance, filename):
     """
     return os.path.join(
         f'Output Result Files/{instance.uploaded_by.organisation_name}/{instance.uploaded_by.user.username}/{instance.uploaded_date.date()}/{filename}')
+
+def get_civis_scores_path(instance):
+    """
+    Returns the MEDIA directory keeping the Civis ML model scores of an uploaded file between predictions
+    Eg: /MEDIA/Civis Scores/42
+    """
+    return os.path.join(settings.MEDIA_ROOT, 'Civis Scores', str(instance.pk))
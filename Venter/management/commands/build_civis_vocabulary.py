@@ -0,0 +1,48 @@
+"""
+Builds the reduced word model of the Civis model from the GoogleNews word2vec file (settings.CIVIS_WORDMODEL).
+
+The settings.CIVIS_WORDMODEL_VOCAB_SIZE most frequent words are kept, plus every word of the category files
+and of the workbooks uploaded by CIVIS so far, as float32 vectors in settings.CIVIS_WORDMODEL_STORE.
+The Civis model then maps the store in milliseconds instead of loading the 3.6 GB model for every prediction.
+Run it again to add the words of the newer uploads, the running processes pick the new store up on restart.
+
+Usage:
+    python manage.py build_civis_vocabulary
+    python manage.py build_civis_vocabulary --vocab-size 100000 --no-uploads
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from Venter.ML_model import embeddings
+from Venter.ML_model.Civis import csvparser
+from Venter.ML_model.Civis.sentencemodel import categoryWords
+from Venter.models import File
+
+
+class Command(BaseCommand):
+    help = 'Builds the reduced word model of the Civis model'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vocab-size', type=int, default=settings.CIVIS_WORDMODEL_VOCAB_SIZE,
+                            help='number of most frequent words kept')
+        parser.add_argument('--no-uploads', action='store_true', help="don't add the words of the past uploads")
+
+    def handle(self, *args, **options):
+        words = categoryWords()
+        if not options['no_uploads']:
+            uploads = File.objects.filter(uploaded_by__organisation_name__organisation_name='CIVIS')
+            for upload in uploads:
+                try:
+                    domainResponses = csvparser.parse(upload.input_file.path)
+                except Exception as error:
+                    self.stderr.write('Skipping %s: %s' % (upload.input_file.name, error))
+                    continue
+                for responses in domainResponses.values():
+                    for response in responses:
+                        words.update(response.split())
+        self.stdout.write('%d words of the category files and uploads' % len(words))
+
+        index, vectors = embeddings.read_civis(options['vocab_size'], words)
+        embeddings.EmbeddingStore.save(embeddings.CIVIS_STORE, vectors, index)
+        self.stdout.write('Civis: %d x %d written to %s.npy' % (vectors.shape + (embeddings.CIVIS_STORE,)))
@@ -0,0 +1,34 @@
+"""
+One-time conversion of the word embeddings of the classification models into float32 .npy matrices
+plus a .vocab.json word -> row index, which Venter/ML_model/embeddings.py then opens with np.load(mmap_mode='r').
+
+The matrices are stored exactly as the models use them: for MCGM that is the fine tuned word_embedding
+of the checkpoint (trained from the normalized word_vectors_mcgm.pickle), for SpeakUp the raw word2vec
+vectors, which its classifier averages without normalizing.
+
+Usage:
+    python manage.py convert_embeddings
+    python manage.py convert_embeddings --model speakup
+"""
+
+from django.core.management.base import BaseCommand
+
+from Venter.ML_model import embeddings
+
+
+class Command(BaseCommand):
+    help = 'Converts the model word embeddings into memory-mappable .npy files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=['all', 'mcgm', 'speakup'], default='all')
+
+    def handle(self, *args, **options):
+        if options['model'] in ('all', 'mcgm'):
+            index, vectors = embeddings.read_mcgm()
+            embeddings.EmbeddingStore.save(embeddings.MCGM_STORE, vectors, index)
+            self.stdout.write('MCGM: %d x %d written to %s.npy' % (vectors.shape + (embeddings.MCGM_STORE,)))
+
+        if options['model'] in ('all', 'speakup'):
+            index, vectors = embeddings.read_speakup()
+            embeddings.EmbeddingStore.save(embeddings.SPEAKUP_STORE, vectors, index)
+            self.stdout.write('SpeakUp: %d x %d written to %s.npy' % (vectors.shape + (embeddings.SPEAKUP_STORE,)))
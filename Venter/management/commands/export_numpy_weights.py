@@ -0,0 +1,69 @@
+"""
+One-time export of the weights of the MCGM and SpeakUp checkpoints into the .npz files of
+Venter/ML_model/numpy_graph.py, after which the classification services run without tensorflow.
+
+The word embeddings are saved by convert_embeddings, they are written here too if they haven't been yet.
+Every export is checked: random inputs are run through both the TF graph and the NumPy graph,
+the command fails if their probabilities differ by more than --tolerance.
+
+Usage:
+    python manage.py export_numpy_weights
+    python manage.py export_numpy_weights --model speakup
+"""
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from Venter.ML_model import embeddings, numpy_graph
+
+
+class Command(BaseCommand):
+    help = 'Exports the weights of the classification graphs for the NumPy inference'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=['all', 'mcgm', 'speakup'], default='all')
+        parser.add_argument('--tolerance', type=float, default=1e-4,
+                            help='largest accepted difference between the TF and NumPy probabilities')
+        parser.add_argument('--samples', type=int, default=256, help='number of random inputs of the check')
+
+    def check(self, name, tf_graph, np_graph, data, tolerance):
+        difference = np.abs(tf_graph.run(data) - np_graph.run(data)).max()
+        self.stdout.write('%s: largest difference of the probabilities over %d inputs %g' % (
+            name, len(data), difference))
+        if difference > tolerance:
+            raise CommandError('%s: the NumPy graph differs from the TF graph by %g' % (name, difference))
+
+    def handle(self, *args, **options):
+        random = np.random.RandomState(0)
+
+        if options['model'] in ('all', 'mcgm'):
+            if not embeddings.EmbeddingStore.exists(embeddings.MCGM_STORE):
+                index, vectors = embeddings.read_mcgm()
+                embeddings.EmbeddingStore.save(embeddings.MCGM_STORE, vectors, index)
+            numpy_graph.save_weights(numpy_graph.MCGM_WEIGHTS, numpy_graph.read_mcgm_weights())
+            self.stdout.write('MCGM: weights written to %s' % numpy_graph.MCGM_WEIGHTS)
+
+            from Venter.ML_model.model.ImportGraph import ImportGraph
+            tf_graph = ImportGraph.get_instance()
+            np_graph = numpy_graph.MCGMNumpyGraph(
+                numpy_graph.load_weights(numpy_graph.MCGM_WEIGHTS), *embeddings.mcgm_embeddings())
+            data = random.randint(0, len(np_graph.word_vectors),
+                                  (options['samples'], np_graph.max_padded_sentence_length))
+            self.check('MCGM', tf_graph, np_graph, data, options['tolerance'])
+
+        if options['model'] in ('all', 'speakup'):
+            if not embeddings.EmbeddingStore.exists(embeddings.SPEAKUP_STORE):
+                index, vectors = embeddings.read_speakup()
+                embeddings.EmbeddingStore.save(embeddings.SPEAKUP_STORE, vectors, index)
+            numpy_graph.save_weights(numpy_graph.SPEAKUP_WEIGHTS, numpy_graph.read_speakup_weights())
+            self.stdout.write('SpeakUp: weights written to %s' % numpy_graph.SPEAKUP_WEIGHTS)
+
+            from Venter.ML_model.SpeakUp.Model.SpeakupImportGraph import ImportGraph
+            tf_graph = ImportGraph.get_instance()
+            np_graph = numpy_graph.SpeakupNumpyGraph(
+                numpy_graph.load_weights(numpy_graph.SPEAKUP_WEIGHTS), embeddings.speakup_embeddings())
+            # Averages of random word vectors, as the SpeakUp graph is fed
+            vectors = np_graph.vecs.vectors
+            words = random.randint(0, len(vectors), (options['samples'], 10))
+            data = np.asarray(vectors[words.ravel()], dtype=np.float32).reshape(words.shape + (-1,)).mean(axis=1)
+            self.check('SpeakUp', tf_graph, np_graph, data, options['tolerance'])
@@ -0,0 +1,88 @@
+"""
+Reports the resident and shared memory of every uWSGI worker, to check that the embedding stores
+memory mapped by the workers (see Venter/ML_model/embeddings.py) are really shared by them.
+
+Usage:
+    python manage.py ml_memory_report
+    python manage.py ml_memory_report --pid 1234 --pid 1235
+"""
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def read_smaps(pid):
+    """
+    Returns the memory counters (in kB) of /proc/<pid>/smaps_rollup, summing /proc/<pid>/smaps on older kernels
+    """
+    counters = {}
+    path = '/proc/%d/smaps_rollup' % pid
+    if not os.path.exists(path):
+        path = '/proc/%d/smaps' % pid
+    with open(path) as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                key = parts[0].rstrip(':')
+                counters[key] = counters.get(key, 0) + int(parts[1])
+    return counters
+
+
+def find_processes(name):
+    """
+    Returns [(pid, parent pid)] of the processes whose command line contains name
+    """
+    processes = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/%s/cmdline' % entry, 'rb') as cmdline:
+                command = cmdline.read().replace(b'\0', b' ').decode('utf-8', 'replace')
+            with open('/proc/%s/stat' % entry) as stat:
+                # the command in /proc/<pid>/stat is in parentheses and may contain spaces
+                ppid = int(stat.read().rsplit(')', 1)[1].split()[1])
+        except OSError:
+            continue
+        if name in command and int(entry) != os.getpid():
+            processes.append((int(entry), ppid))
+    return sorted(processes)
+
+
+class Command(BaseCommand):
+    help = 'Reports resident vs shared memory of the uWSGI workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pid', type=int, action='append',
+                            help='Process to report, defaults to every uWSGI process')
+        parser.add_argument('--name', default='uwsgi', help='Command line substring used to find the processes')
+
+    def handle(self, *args, **options):
+        if not os.path.isdir('/proc'):
+            raise CommandError('/proc is required to read the memory maps')
+
+        if options['pid']:
+            processes = [(pid, None) for pid in options['pid']]
+        else:
+            processes = find_processes(options['name'])
+            if not processes:
+                raise CommandError("No process matching '%s' found" % options['name'])
+        pids = set(pid for pid, _ in processes)
+
+        self.stdout.write('%8s %8s %12s %12s %12s %12s' % (
+            'PID', 'ROLE', 'RSS (MB)', 'PSS (MB)', 'SHARED (MB)', 'PRIVATE (MB)'))
+        for pid, ppid in processes:
+            try:
+                counters = read_smaps(pid)
+            except OSError as e:
+                self.stderr.write('%d: %s' % (pid, e))
+                continue
+            if ppid is None:
+                role = '-'
+            else:
+                role = 'worker' if ppid in pids else 'master'
+            shared = counters.get('Shared_Clean', 0) + counters.get('Shared_Dirty', 0)
+            private = counters.get('Private_Clean', 0) + counters.get('Private_Dirty', 0)
+            self.stdout.write('%8d %8s %12.1f %12.1f %12.1f %12.1f' % (
+                pid, role, counters.get('Rss', 0) / 1024, counters.get('Pss', 0) / 1024, shared / 1024, private / 1024))
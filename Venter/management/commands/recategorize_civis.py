@@ -0,0 +1,36 @@
+"""
+Queues a new prediction of the Civis files which already have one, to be run after editing data/sentences.
+
+The scores of every file are kept between predictions, so the prediction workers only score the categories
+which were added or edited, then derive the assignment and the Novel subcategories again.
+
+Files given with --file are queued even without a prediction, which is how a failed prediction is run again:
+the results page shows the failure instead of queueing the same job over and over.
+
+Usage:
+    python manage.py recategorize_civis
+    python manage.py recategorize_civis --file 12 --file 15
+"""
+
+from django.core.management.base import BaseCommand
+
+from Venter import prediction_jobs
+from Venter.models import File
+
+
+class Command(BaseCommand):
+    help = 'Queues the re-categorization of the predicted Civis files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', type=int, action='append', dest='files', help='pk of a file, repeatable')
+
+    def handle(self, *args, **options):
+        files = File.objects.filter(uploaded_by__organisation_name__organisation_name='CIVIS')
+        if options['files']:
+            files = files.filter(pk__in=options['files'])
+        else:
+            files = files.filter(has_prediction=True)
+
+        for filemeta in files:
+            job = prediction_jobs.enqueue(filemeta)
+            self.stdout.write('%s: job %d %s' % (filemeta.filename, job.pk, job.state))
@@ -0,0 +1,70 @@
+"""
+Worker process executing the queued PredictionJobs.
+
+At most settings.PREDICTION_MAX_CONCURRENT_JOBS jobs run at the same time, each on its own thread
+so that they share the word embedding loaded by the process.
+With settings.CIVIS_WORKERS > 1 the Civis model forks a pool of processes from the thread of its job, and forking
+while other jobs run threads can deadlock the children: the jobs are then run one at a time.
+
+Usage:
+    python manage.py run_prediction_worker
+    python manage.py run_prediction_worker --concurrency 1 --once
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from Venter import prediction_jobs
+
+
+def execute(job):
+    try:
+        return prediction_jobs.run_job(job)
+    finally:
+        # Every thread has its own database connection
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Executes the queued prediction jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.PREDICTION_MAX_CONCURRENT_JOBS,
+                            help='Maximum number of jobs running at the same time')
+        parser.add_argument('--poll-interval', type=float, default=settings.PREDICTION_WORKER_POLL_INTERVAL,
+                            help='Seconds to wait between two looks at the queue')
+        parser.add_argument('--once', action='store_true', help='Exit as soon as the queue is empty')
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        if settings.CIVIS_WORKERS > 1 and concurrency > 1:
+            self.stdout.write('CIVIS_WORKERS is %d, the jobs fork their own pool of processes and run one at a time'
+                              % settings.CIVIS_WORKERS)
+            concurrency = 1
+        requeued = prediction_jobs.requeue_stale_jobs()
+        if requeued:
+            self.stdout.write('%d stale jobs queued again' % requeued)
+        self.stdout.write('Prediction worker started, running up to %d jobs at a time' % concurrency)
+
+        running = set()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                for future in [future for future in running if future.done()]:
+                    running.remove(future)
+                    job = future.result()
+                    self.stdout.write('Job %d (%s): %s' % (job.pk, job.file.filename, job.state))
+
+                while len(running) < concurrency:
+                    job = prediction_jobs.claim_next_job()
+                    if job is None:
+                        break
+                    self.stdout.write('Job %d (%s): running' % (job.pk, job.file.filename))
+                    running.add(executor.submit(execute, job))
+
+                if options['once'] and not running:
+                    break
+                time.sleep(options['poll_interval'])
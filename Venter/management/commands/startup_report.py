@@ -0,0 +1,95 @@
+"""
+Reports how long a fresh process takes to import the urls, i.e. what every uWSGI worker pays before
+serving its first request, from the output of `python -X importtime`.
+The option only exists since Python 3.7, older interpreters ignore it and only the imported modules are reported.
+
+The modules of HEAVY_MODULES are the ML stack, which Venter/ml.py keeps out of the urls;
+Venter/tests.py fails if any of them is imported again. They are looked up in the sys.modules of the process,
+which every Python version reports.
+
+Usage:
+    python manage.py startup_report
+    python manage.py startup_report --top 30 --repeat 5
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+HEAVY_MODULES = ('tensorflow', 'gensim', 'nltk', 'sklearn', 'scipy', 'pandas')
+
+# The names of sys.modules are printed as the last line of stdout, the importtime lines go to stderr
+STARTUP_CODE = 'import django, json, sys; django.setup(); import %s; print(json.dumps(sorted(sys.modules)))' % (
+    settings.ROOT_URLCONF)
+
+
+def startup_imports():
+    """
+    Imports the urls in a new interpreter and returns the sorted names of its modules and
+    [(module, self microseconds, cumulative microseconds)] of every module it imported, in import order.
+    The times are empty before Python 3.7
+    """
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'Backend.settings'))
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_CODE], cwd=settings.BASE_DIR,
+                             env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode:
+        raise RuntimeError('Importing the urls failed:\n%s' % process.stderr)
+    modules = json.loads(process.stdout.splitlines()[-1])
+
+    times = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        if self_time.strip().isdigit():
+            # the name is indented by two spaces per level of nesting, after the space following the separator
+            times.append((name[1:].rstrip(), int(self_time), int(cumulative)))
+    return modules, times
+
+
+def total_time(times):
+    """
+    Returns the import time in microseconds, the sum of the cumulative times of the top level imports
+    """
+    return sum(cumulative for name, _, cumulative in times if not name.startswith(' '))
+
+
+def heavy_modules(modules):
+    """
+    Returns the packages of HEAVY_MODULES which are among the imported modules
+    """
+    imported = set(name.split('.')[0] for name in modules)
+    return [module for module in HEAVY_MODULES if module in imported]
+
+
+class Command(BaseCommand):
+    help = 'Reports the time a new worker takes to import the urls'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15, help='number of slowest top level packages shown')
+        parser.add_argument('--repeat', type=int, default=3, help='number of runs, the fastest one is reported')
+
+    def handle(self, *args, **options):
+        try:
+            runs = [startup_imports() for _ in range(options['repeat'])]
+        except RuntimeError as e:
+            raise CommandError(e)
+        modules, times = min(runs, key=lambda run: total_time(run[1]))
+
+        if times:
+            self.stdout.write('Importing %s: %.3f secs, %d modules loaded' % (
+                settings.ROOT_URLCONF, total_time(times) / 1e6, len(modules)))
+        else:
+            self.stdout.write('Importing %s: %d modules loaded, python -X importtime needs Python 3.7 for the times' % (
+                settings.ROOT_URLCONF, len(modules)))
+        top_level = sorted((cumulative, name) for name, _, cumulative in times if not name.startswith(' '))
+        for cumulative, name in reversed(top_level[-options['top']:]):
+            self.stdout.write('%10.1f ms  %s' % (cumulative / 1e3, name))
+
+        heavy = heavy_modules(modules)
+        if heavy:
+            self.stdout.write('ML modules imported by the urls: %s' % ', '.join(heavy))
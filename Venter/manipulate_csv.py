@@ -33,15 +33,32 @@ Structure of Dict_List which will be sent to the frontend:
             ]
 """
 
-import operator
 import os
 
 import pandas as pd
 from django.conf import settings
 
-from Venter.ML_model.model.ClassificationService import ClassificationService
-from Venter.ML_model.SpeakUp.Model.SpeakupClassificationService import \
-    ClassificationService_speakup
+from Venter.ML_model.registry import get_model
+
+
+def category_frame(indices, probs, labels, index=None):
+    """
+    Column-wise post-processing of the classifier output.
+
+    indices and probs are the [n_rows, k] arrays of the top k categories sorted by decreasing probability,
+    labels is the label table of the classifier (with the marathi categories already translated).
+    Returns a DataFrame with the 'Predicted category 1..k' columns followed by the 'Probability 1..k'
+    columns holding the integer percentages.
+    """
+    k = indices.shape[1]
+    names = labels[indices]
+    percentages = (probs * 100).astype(int)
+    columns = {}
+    for i in range(k):
+        columns['Predicted category %d' % (i + 1)] = names[:, i]
+    for i in range(k):
+        columns['Probability %d' % (i + 1)] = percentages[:, i]
+    return pd.DataFrame(columns, index=index, columns=list(columns))
 
 
 class EditCsv:
@@ -71,28 +88,15 @@ class EditCsv:
         company_columns = []
         category_list = []
         if self.group == "ICMC":
-            try:
-                # Here we need to check whether an object of ClassificationService is already been created or not.
-                # So we are creating the object of ClassificationService class each time when we upload the file.
-                # This object can have the reference for ICMC model class or SpeakUp model class depending upon the group of the user.
-                # To reduce the redundancy of the objects we are checking whether it has the attribute 'get_top_3_cats_with_prob' which is the function used to call the model.
-                if not hasattr(self.cs, 'get_top_3_cats_with_prob'):
-                    self.cs = ClassificationService()
-                    # if the object is already been created, do nothing
-            except Exception as e:
-                print(e)
-                self.cs = ClassificationService()
+            # The ClassificationService object can have the reference for ICMC model class or SpeakUp model class
+            # depending upon the group of the user.
+            # The model registry loads each of them only once per process and shares it between all the uploads.
+            self.cs = get_model(self.group)
             company_columns = settings.ICMC_HEADERS
             category_list = settings.ICMC_CATEGORY_LIST
 
         elif self.group == "SpeakUP":
-            try:
-                if not hasattr(self.cs, 'get_top_3_cats_with_prob'):
-                    self.cs = ClassificationService_speakup()
-
-            except Exception as e:
-                print(e)
-                self.cs = ClassificationService_speakup()
+            self.cs = get_model(self.group)
             company_columns = settings.SPEAKUP_HEADERS
             category_list = settings.SPEAKUP_CATEGORY_LIST
 
@@ -135,85 +139,64 @@ class EditCsv:
             sep=',',
             encoding='utf-8', index=False)
 
-    def read_file(self):
-        """This method will predict the categories from the data of the csv file with encoding='utf-8' for MCGM"""
-        # Reading the csvfile through pandas
-        csvfile = pd.read_csv(settings.MEDIA_ROOT + "/" + self.username + "/CSV/input" + "/" + self.filename, sep=',',
-                              header=0, encoding='utf-8')
-
-        dict_list = []  # Structure is given at the top.
-        description = []  # To check if there is a description in the file/row or not
-        # These lists will be used for creating the difference file
-        cat1 = []
-        cat2 = []
-        cat3 = []
-
-        for row in csvfile.iterrows():
-            # Iterate to each row of the file to separate the categories, title and description with the rest of the data
-            dict = {}  # Each row will be a dictionary (See above mentioned structure for reference
-            index, data = row  # Separating Index and data from the rows, Index will be used to map the category corresponding to which row
-            dict['index'] = index
+    def iter_predictions(self, chunksize=None):
+        """
+        Streams the predictions for the uploaded csv file, yielding one dict (see the structure at the top) per row.
+
+        The file is read chunksize rows at a time (settings.CSV_CHUNK_SIZE by default), every chunk is classified
+        as a batch and its rows are appended to Difference.csv before the next chunk is read,
+        so the memory used doesn't depend on the size of the file.
+        """
+        self.cs = get_model(self.group)
+        chunksize = chunksize or settings.CSV_CHUNK_SIZE
+        difference_path = os.path.join(settings.MEDIA_ROOT, self.username, "CSV", "output", "Difference.csv")
+        difference_columns = ['Predicted category 1', 'Predicted category 2', 'Predicted category 3',
+                              'Complaint Description']
+        # The header is written first, every chunk is then appended to the difference file
+        pd.DataFrame(columns=difference_columns).to_csv(difference_path, sep=',', encoding='utf-8', index=False)
+
+        chunks = pd.read_csv(os.path.join(settings.MEDIA_ROOT, self.username, "CSV", "input", self.filename), sep=',',
+                             header=0, encoding='utf-8', chunksize=chunksize)
+        for chunk in chunks:
             if self.group == "ICMC":
                 # Categories (as mentioned earlier) will be different for each group
-                complaint_title = data['complaint_title']
+                # The whole complaint_title column of the chunk is classified in batches
+                indices, probs = self.cs.get_top_k_batch(list(chunk['complaint_title']), k=3,
+                                                         batch_size=settings.ML_BATCH_SIZE)
+                categories = category_frame(indices, probs, self.cs.labels, chunk.index)
                 # We are separating description to show it in the frontend for the clients
-                complaint_description = data['complaint_description']
-                description.append(complaint_description)
-                dict['problem_description'] = complaint_description
-                try:
-                    # The ML model will take complaint_title which is a list as an input
-                    # and gives categories in an dictionary format like:
-                    # cats = {'category1':80, 'category2':10, 'category3':10}
-                    cats = self.cs.get_top_3_cats_with_prob(complaint_title)
-                except Exception as e:
-                    break
+                description = chunk['complaint_description']
 
             elif self.group == "SpeakUP":
                 # Just like ICMC, SpeakUp will have different categories.
-                # The ML model will get 'text' field as a list in input
-                complaint_title = str(data['text'])
-                if complaint_title != 'nan':
-                    dict['problem_description'] = complaint_title
-                    description.append(complaint_title)
-                    cats = self.cs.get_top_3_cats_with_prob(complaint_title)
-                else:
-                    # There maybe a case where there is nothing in the text field, in that case the ML model will not predict for that row
-                    description.append("Problem description not found")
-                    dict['problem_description'] = "Problem description not found"
-                    cats = {'None': 1}
-
-            for k in cats:
-                # In ICMC, there are 2 categories which are being prdicted in marathi.
-                # This iteration replaces marathi with english
-                # Source: https://stackoverflow.com/questions/4406501/change-the-name-of-a-key-in-dictionary
-                cats[k] = int(cats[k] * 100)
-                if k == 'मॅनहोलमध्ये व्यक्ती पडणे':
-                    temp = cats[k]
-                    cats["Person falling in Manhole"] = temp / 100
-                    del cats['मॅनहोलमध्ये व्यक्ती पडणे']
-
-                elif k == 'थकबाकी येणे बाकी':
-                    temp = cats[k]
-                    cats["Outstanding dues pending"] = temp / 100
-                    del cats['थकबाकी येणे बाकी']
-
-            # The dictionary (cats) from the ML model was not sorted based it's values (accuracy percentage)
-            sorted_cats = sorted(cats.items(), key=operator.itemgetter(1), reverse=True)
-
-            # Lists for Difference File
-            cat1.append(sorted_cats[0][0])
-            cat2.append(sorted_cats[1][0])
-            cat3.append(sorted_cats[2][0])
-
-            dict['category'] = sorted_cats
-            dict_list.append(dict)
-
-        df = pd.DataFrame({'Predicted category 1': cat1, 'Predicted category 2': cat2, 'Predicted category 3': cat3,
-                           'Complaint Description': description})
-
-        df.to_csv(os.path.join(settings.MEDIA_ROOT, self.username, "CSV", "output", "Difference.csv"), sep=',',
-                  encoding='utf-8', index=False)
-
-        # After doing everything, don't forget to delete the object reference of the ClassificationService class
-        del self.cs
-        return dict_list, csvfile.shape[0]
+                # The ML model will get 'text' field as an input, there maybe a case where there is nothing
+                # in the text field, in that case the ML model will not predict for that row
+                has_text = chunk['text'].notna()
+                texts = chunk['text'][has_text].astype(str)
+                indices, probs = self.cs.get_top_k_batch(list(texts), k=3, batch_size=settings.ML_BATCH_SIZE)
+                categories = category_frame(indices, probs, self.cs.labels, texts.index)
+                categories = categories.reindex(chunk.index).fillna({
+                    'Predicted category 1': 'None', 'Predicted category 2': '', 'Predicted category 3': '',
+                    'Probability 1': 100, 'Probability 2': 0, 'Probability 3': 0,
+                }).astype({'Probability 1': int, 'Probability 2': int, 'Probability 3': int})
+                description = chunk['text'].astype(str).where(has_text, "Problem description not found")
+
+            df = categories[difference_columns[:3]].copy()
+            df['Complaint Description'] = description
+            df.to_csv(difference_path, sep=',', encoding='utf-8', index=False, header=False, mode='a')
+
+            for index, row, problem_description in zip(chunk.index, categories.itertuples(index=False), description):
+                # Each row will be a dictionary (See above mentioned structure for reference)
+                # Index will be used to map the category corresponding to which row
+                yield {
+                    'index': index,
+                    'problem_description': problem_description,
+                    'category': [(row[i], int(row[i + 3])) for i in range(3) if row[i]],
+                }
+
+        print('Prediction cache %s' % self.cs.cache)
+
+    def read_file(self):
+        """This method will predict the categories from the data of the csv file with encoding='utf-8' for MCGM"""
+        dict_list = list(self.iter_predictions())  # Structure is given at the top.
+        return dict_list, len(dict_list)
@@ -0,0 +1,35 @@
+# Generated by Django 2.1.2 on 2026-10-17 13:00
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Venter', '0025_auto_20190307_1620'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PredictionJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('domains_total', models.PositiveIntegerField(default=0)),
+                ('domains_done', models.PositiveIntegerField(default=0)),
+                ('current_domain', models.CharField(blank=True, max_length=200)),
+                ('error', models.TextField(blank=True)),
+                ('worker_pid', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_date', models.DateTimeField(default=datetime.datetime.now)),
+                ('started_date', models.DateTimeField(blank=True, null=True)),
+                ('finished_date', models.DateTimeField(blank=True, null=True)),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prediction_jobs', to='Venter.File')),
+            ],
+            options={
+                'verbose_name_plural': 'Prediction Jobs',
+                'ordering': ['-created_date'],
+            },
+        ),
+    ]
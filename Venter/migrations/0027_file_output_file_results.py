@@ -0,0 +1,18 @@
+# Generated by Django 2.1.2 on 2026-10-17 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Venter', '0026_predictionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='output_file_results',
+            field=models.FileField(blank=True, upload_to=''),
+        ),
+    ]
@@ -0,0 +1,26 @@
+"""Entry points of the ML stack for the views and the prediction jobs
+
+Importing pandas, sklearn, nltk, gensim and tensorflow takes seconds, which every uWSGI worker paid
+while importing the urls before it could serve even the login page.
+Nothing of the ML stack is imported by this module: each function imports what it needs when first called,
+the classification models themselves are loaded by Venter.ML_model.registry.
+
+`python manage.py startup_report` shows what the urls import and how long it takes.
+
+This python file can be imported and contains the following
+functions:
+    1) edit_csv - returns the EditCsv handling an uploaded ICMC or SpeakUp csv file
+    2) similarity_mapping - returns the SimilarityMapping running the Civis model over an uploaded workbook
+"""
+
+
+def edit_csv(file_name, user_name, company):
+    from Venter.manipulate_csv import EditCsv
+
+    return EditCsv(file_name, user_name, company)
+
+
+def similarity_mapping(path, state_directory=None):
+    from Venter.ML_model.Civis.modeldriver import SimilarityMapping
+
+    return SimilarityMapping(path, state_directory)
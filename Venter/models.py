@@ -1,4 +1,5 @@
 import os
+import shutil
 from datetime import date, datetime
 
 from django.contrib.auth.models import User
@@ -6,7 +7,9 @@ from django.core.files.storage import default_storage
 from django.core.validators import RegexValidator
 from django.db import models
 
-from .helpers import get_file_upload_path, get_organisation_logo_path, get_user_profile_picture_path, get_result_file_path
+from .helpers import (get_civis_scores_path, get_file_upload_path,
+                      get_organisation_logo_path, get_result_file_path,
+                      get_user_profile_picture_path)
 
 
 class Organisation(models.Model):
@@ -144,6 +147,7 @@ class File(models.Model):
     )
     output_file_json = models.FileField(blank=True)
     output_file_xlsx = models.FileField(blank=True)
+    output_file_results = models.FileField(blank=True)
 
     @property
     def filename(self):
@@ -161,10 +165,88 @@ class File(models.Model):
             default_storage.delete(self.output_file_json)
         if self.output_file_xlsx:
             default_storage.delete(self.output_file_xlsx)
+        if self.output_file_results:
+            default_storage.delete(self.output_file_results)
         default_storage.delete(self.input_file)
+        shutil.rmtree(get_civis_scores_path(self), ignore_errors=True)
         print("\n\nInput file should be gone\n\n")
         super().delete()
 
     class Meta:
         verbose_name_plural = 'File'
         ordering=["-uploaded_date"]
+
+
+class PredictionJob(models.Model):
+    """
+    A background run of the Civis ML model over an uploaded File.
+    Jobs are queued by the predict_result view and executed by `python manage.py run_prediction_worker`,
+    the database is the only thing the view and the worker share.
+
+    # Queue a prediction for a file
+    >>> PredictionJob.objects.create(file=file_1)
+
+    States------
+        queued -> running -> done
+                          -> failed (the traceback is kept in 'error')
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATE_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    file = models.ForeignKey(
+        File,
+        on_delete=models.CASCADE,
+        related_name='prediction_jobs',
+    )
+    state = models.CharField(
+        max_length=10,
+        choices=STATE_CHOICES,
+        default=QUEUED,
+    )
+    domains_total = models.PositiveIntegerField(
+        default=0,
+    )
+    domains_done = models.PositiveIntegerField(
+        default=0,
+    )
+    current_domain = models.CharField(
+        max_length=200,
+        blank=True,
+    )
+    error = models.TextField(
+        blank=True,
+    )
+    worker_pid = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+    )
+    created_date = models.DateTimeField(
+        default=datetime.now,
+    )
+    started_date = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+    finished_date = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+
+    @property
+    def is_active(self):
+        return self.state in (self.QUEUED, self.RUNNING)
+
+    def __str__(self):
+        return '%s (%s)' % (self.file.filename, self.state)
+
+    class Meta:
+        verbose_name_plural = 'Prediction Jobs'
+        ordering = ["-created_date"]
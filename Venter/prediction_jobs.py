@@ -0,0 +1,138 @@
+"""Background prediction jobs
+
+The Civis ML model takes minutes on real workbooks, so predict_result only queues a PredictionJob
+and the jobs are executed by a separate worker process: `python manage.py run_prediction_worker`.
+The database is the queue, no external broker is needed.
+
+This python file can be imported and contains the following
+functions:
+    1) enqueue - returns the active job of a file, queueing a new one if there is none
+    2) claim_next_job - atomically moves the oldest queued job to running and returns it
+    3) run_job - executes a claimed job, recording its progress per domain and its final state
+    4) predict - runs the model over a file and saves the json and xlsx outputs on it
+    5) requeue_stale_jobs - queues again the jobs left running by a worker that died
+"""
+
+import json
+import os
+import traceback
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from Venter import ml, result_store
+from Venter.helpers import get_civis_scores_path
+from Venter.models import File, PredictionJob
+
+
+def enqueue(filemeta):
+    """
+    Returns the queued or running job of filemeta, or queues a new one.
+    The row of the file is locked until the job is created, so two requests for the same file (a double click,
+    two tabs) can't both queue a job and have them write the same output files at the same time.
+    """
+    with transaction.atomic():
+        if connection.features.has_select_for_update:
+            File.objects.select_for_update().get(pk=filemeta.pk)
+        else:
+            # SQLite has no row locks, writing to the file takes its database write lock for the transaction
+            File.objects.filter(pk=filemeta.pk).update(has_prediction=F('has_prediction'))
+        job = PredictionJob.objects.filter(
+            file=filemeta, state__in=[PredictionJob.QUEUED, PredictionJob.RUNNING]).first()
+        if job is None:
+            job = PredictionJob.objects.create(file=filemeta)
+    return job
+
+
+def claim_next_job():
+    """
+    Moves the oldest queued job to the running state and returns it, None if the queue is empty.
+    The state filter of the update makes the claim atomic when several workers poll the same database.
+    """
+    while True:
+        job = PredictionJob.objects.filter(state=PredictionJob.QUEUED).order_by('created_date').first()
+        if job is None:
+            return None
+        claimed = PredictionJob.objects.filter(pk=job.pk, state=PredictionJob.QUEUED).update(
+            state=PredictionJob.RUNNING, started_date=datetime.now(), worker_pid=os.getpid())
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def requeue_stale_jobs():
+    """
+    Jobs still running with the pid of a process that no longer exists are queued again,
+    returns the number of requeued jobs
+    """
+    requeued = 0
+    for job in PredictionJob.objects.filter(state=PredictionJob.RUNNING):
+        try:
+            os.kill(job.worker_pid, 0)
+        except (OSError, TypeError):
+            requeued += PredictionJob.objects.filter(pk=job.pk, state=PredictionJob.RUNNING).update(
+                state=PredictionJob.QUEUED, worker_pid=None, domains_done=0, current_domain='')
+    return requeued
+
+
+def predict(filemeta, progress=None):
+    """
+    Runs the Civis model over the uploaded file and saves its json and xlsx results and
+    the per domain results container (see result_store.py) in its output directory.
+    The directory is shared by the files a user uploads on the same day, the outputs are named after the file
+    """
+    profile = filemeta.uploaded_by
+    output_directory_path = os.path.join(settings.MEDIA_ROOT, str(profile.organisation_name), profile.user.username,
+                                         str(filemeta.uploaded_date.date()), 'output')
+
+    if not os.path.exists(output_directory_path):
+        os.makedirs(output_directory_path)
+
+    output_file_path_json = os.path.join(output_directory_path, result_store.results_filename(filemeta, 'json'))
+    output_file_path_xlsx = os.path.join(output_directory_path, result_store.results_filename(filemeta, 'xlsx'))
+    output_file_path_results = os.path.join(output_directory_path, result_store.results_filename(filemeta))
+
+    # The scores are kept per file, a rerun after a change of the category files only scores the changed categories
+    sm = ml.similarity_mapping(filemeta.input_file.path, get_civis_scores_path(filemeta))
+    dict_data = sm.driver(progress)
+
+    with open(output_file_path_json, 'w') as temp:
+        json.dump(dict_data, temp)
+
+    print('JSON output saved.')
+
+    result_store.write_results(output_file_path_results, dict_data)
+
+    result_store.write_xlsx(output_file_path_xlsx, dict_data)
+
+    print('Excel output saved.')
+
+    filemeta.output_file_json = output_file_path_json
+    filemeta.output_file_xlsx = output_file_path_xlsx
+    filemeta.output_file_results = output_file_path_results
+    filemeta.has_prediction = bool(dict_data)
+    filemeta.save()
+    return dict_data
+
+
+def run_job(job):
+    """
+    Executes a job claimed with claim_next_job(), the job ends up either done or failed
+    """
+    def progress(domain, domains_done, domains_total):
+        PredictionJob.objects.filter(pk=job.pk).update(
+            current_domain=domain, domains_done=domains_done, domains_total=domains_total)
+
+    try:
+        predict(job.file, progress)
+    except Exception:
+        print('Prediction job %d failed.' % job.pk)
+        PredictionJob.objects.filter(pk=job.pk).update(
+            state=PredictionJob.FAILED, error=traceback.format_exc(), finished_date=datetime.now())
+    else:
+        PredictionJob.objects.filter(pk=job.pk).update(
+            state=PredictionJob.DONE, current_domain='', finished_date=datetime.now())
+    job.refresh_from_db()
+    return job
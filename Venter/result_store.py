@@ -0,0 +1,269 @@
+"""Per domain store of the Civis ML model results
+
+results.json holds the results of every domain of a file, so showing one domain meant loading them all.
+The results are also written to a results.bin container: one zlib compressed JSON block per domain
+and the JSON table of its chart (see domain_stats), followed by an index of the offsets and lengths
+of the blocks of every domain, and the offset of that index in the last 8 bytes of the file.
+Listing the domains only reads the index and showing a domain only reads its own blocks.
+
+This python file can be imported and contains the following
+functions:
+    1) write_results - saves the results dict of the model into a container file
+    2) read_domain_list - returns the domains of a container file, in the order of the results
+    3) read_domain - returns the results of one domain of a container file
+    4) read_domain_stats - returns the JSON chart table of one domain of a container file
+    5) domain_stats - returns the chart table of the results of a domain
+    6) results_filename - returns the name of the container file, or of another output file, of an uploaded file
+    7) get_results_path - returns the container file of an uploaded file, building it from results.json if needed
+    8) write_xlsx - saves the results dict of the model into a workbook of one sheet per domain
+
+and the ResultCache class, whose result_cache instance keeps the domains recently shown by this process.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import threading
+import re
+import zlib
+from collections import OrderedDict
+from itertools import zip_longest
+
+from django.conf import settings
+
+MAGIC = b'VENTERR1'
+INDEX_OFFSET = struct.Struct('<Q')
+SHEET_NAME_LENGTH = 31
+SHEET_NAME_INVALID = re.compile(r'[\[\]:*?/\\]')
+# Size of the blocks of a container read at a time when hashing it
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def write_results(path, results):
+    """
+    Saves the {domain: {category: [responses], 'Novel': {subcategory: [responses]}}} results into path
+    """
+    index = []
+    with open(path + '.tmp', 'wb') as container:
+        container.write(MAGIC)
+        for domain, domain_data in results.items():
+            block = zlib.compress(json.dumps(domain_data, separators=(',', ':')).encode('utf-8'))
+            stats = json.dumps(domain_stats(domain_data), separators=(',', ':')).encode('utf-8')
+            index.append([domain, container.tell(), len(block), container.tell() + len(block), len(stats)])
+            container.write(block)
+            container.write(stats)
+        index_offset = container.tell()
+        container.write(json.dumps(index).encode('utf-8'))
+        container.write(INDEX_OFFSET.pack(index_offset))
+    # Renamed once complete, a reader never sees a partially written container
+    os.replace(path + '.tmp', path)
+
+
+def read_index(container):
+    if container.read(len(MAGIC)) != MAGIC:
+        raise ValueError('%s is not a results container' % container.name)
+    container.seek(-INDEX_OFFSET.size, os.SEEK_END)
+    end = container.tell()
+    index_offset, = INDEX_OFFSET.unpack(container.read(INDEX_OFFSET.size))
+    container.seek(index_offset)
+    return json.loads(container.read(end - index_offset).decode('utf-8'))
+
+
+def read_domain_list(path):
+    """
+    Returns the domains of the results saved in path
+    """
+    with open(path, 'rb') as container:
+        return [entry[0] for entry in read_index(container)]
+
+
+def read_block(path, domain, block):
+    with open(path, 'rb') as container:
+        for entry in read_index(container):
+            if entry[0] == domain:
+                if len(entry) < 3 + 2 * block:
+                    return None
+                offset, length = entry[1 + 2 * block:3 + 2 * block]
+                container.seek(offset)
+                return container.read(length)
+    raise KeyError(domain)
+
+
+def read_domain(path, domain):
+    """
+    Returns the {category: [responses], 'Novel': {subcategory: [responses]}} results of domain,
+    raises KeyError if the results have no such domain
+    """
+    return json.loads(zlib.decompress(read_block(path, domain, 0)).decode('utf-8'))
+
+
+def read_domain_stats(path, domain):
+    """
+    Returns the chart table of domain as JSON encoded bytes, raises KeyError if the results have no such domain
+    """
+    stats = read_block(path, domain, 1)
+    if stats is None:
+        # Containers written before the tables were stored
+        stats = json.dumps(domain_stats(read_domain(path, domain)), separators=(',', ':')).encode('utf-8')
+    return stats
+
+
+def domain_stats(domain_data):
+    """
+    Returns the table of the chart of a domain: a header row ['Category', 'Sub category 1', ..., {'role': 'style'}]
+    then one [category, number of responses, 0, ..., ''] row per category, the Novel row holding the number
+    of responses of every subcategory
+    """
+    novel = domain_data.get('Novel', {})
+    header = ['Category'] + ['Sub category %d' % (index + 1) for index in range(len(novel))] + [{'role': 'style'}]
+    padding = [0] * max(len(header) - 3, 0)
+    rows = [header]
+    for category, responselist in domain_data.items():
+        if category == 'Novel':
+            rows.append(['Novel'] + [len(responses) for responses in novel.values()] + [''])
+        else:
+            rows.append([category, len(responselist)] + padding + [''])
+    return rows
+
+
+def results_filename(filemeta, extension='bin'):
+    """
+    Returns the name of the container of filemeta, or of its results.<extension> output,
+    named after the file as the output directory is shared by the files uploaded by a user on the same day
+    """
+    return 'results_%d.%s' % (filemeta.pk, extension)
+
+
+def get_results_path(filemeta):
+    """
+    Returns the path of the results container of filemeta,
+    the files predicted before the containers existed get theirs built from their results.json
+    """
+    if not filemeta.output_file_results:
+        json_path = filemeta.output_file_json.path
+        results_path = os.path.join(os.path.dirname(json_path), results_filename(filemeta))
+        with open(json_path) as temp:
+            write_results(results_path, json.load(temp))
+        filemeta.output_file_results = results_path
+        filemeta.save(update_fields=['output_file_results'])
+    return filemeta.output_file_results.path
+
+
+def sheet_name(domain, used):
+    """
+    Returns a name Excel accepts for the sheet of domain, distinct from the used names
+    """
+    name = SHEET_NAME_INVALID.sub(' ', domain).strip("' ")[:SHEET_NAME_LENGTH] or 'Domain'
+    suffix = 1
+    while name.lower() in used:
+        suffix += 1
+        tail = ' (%d)' % suffix
+        name = name[:SHEET_NAME_LENGTH - len(tail)] + tail
+    used.add(name.lower())
+    return name
+
+
+def write_xlsx(path, results):
+    """
+    Saves the results into a workbook with one sheet per domain and one column per category,
+    the Novel subcategories getting a column each.
+
+    The workbook is written in the constant_memory mode of xlsxwriter: every row is flushed to disk
+    once the next one is started, so the rows are written straight from the response lists
+    and the memory used does not grow with the size of the consultation.
+    """
+    # Only the prediction jobs write workbooks, the views reading the results don't import xlsxwriter
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path + '.tmp', {'constant_memory': True})
+    header_format = workbook.add_format({'bold': True})
+    used = set()
+    for domain, domain_data in results.items():
+        print('Writing Excel for domain %s' % domain)
+        worksheet = workbook.add_worksheet(sheet_name(domain, used))
+        columns = []
+        for category, responselist in domain_data.items():
+            if category == 'Novel':
+                for index, responses in enumerate(responselist.values()):
+                    columns.append(('Novel - Sub category %d' % (index + 1), responses))
+            else:
+                columns.append((category, responselist))
+        for col, (header, _) in enumerate(columns):
+            worksheet.write_string(0, col, header, header_format)
+        for row, responses in enumerate(zip_longest(*[responselist for _, responselist in columns]), 1):
+            for col, response in enumerate(responses):
+                if response is not None:
+                    # write_string, a response starting with = is not a formula
+                    worksheet.write_string(row, col, response)
+    workbook.close()
+    os.replace(path + '.tmp', path)
+
+
+class ResultCache:
+    """
+    LRU cache of the results shown, keyed by File pk, holding the results of at most max_files files.
+
+    The domain list and every domain of a file are read from its container the first time they are asked for,
+    by whichever process serves the request. An entry is dropped when its container is written again,
+    e.g. after the file was re-categorized.
+    """
+
+    def __init__(self, max_files=32):
+        self.max_files = max_files
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def entry(self, filemeta):
+        path = get_results_path(filemeta)
+        version = os.stat(path).st_mtime_ns
+        with self.lock:
+            entry = self.entries.get(filemeta.pk)
+            if entry is None or entry['path'] != path or entry['version'] != version:
+                entry = {'path': path, 'version': version, 'domain_list': None, 'domains': {}, 'stats': {},
+                         'etag': None}
+                self.entries[filemeta.pk] = entry
+            self.entries.move_to_end(filemeta.pk)
+            while len(self.entries) > self.max_files:
+                self.entries.popitem(last=False)
+        return entry
+
+    def domain_list(self, filemeta):
+        entry = self.entry(filemeta)
+        if entry['domain_list'] is None:
+            entry['domain_list'] = read_domain_list(entry['path'])
+        return entry['domain_list']
+
+    def domain(self, filemeta, domain):
+        """
+        Returns the results of a domain of filemeta, raises KeyError if there is no such domain
+        """
+        entry = self.entry(filemeta)
+        if domain not in entry['domains']:
+            entry['domains'][domain] = read_domain(entry['path'], domain)
+        return entry['domains'][domain]
+
+    def domain_stats(self, filemeta, domain):
+        """
+        Returns the JSON encoded chart table of a domain of filemeta, raises KeyError if there is no such domain
+        """
+        entry = self.entry(filemeta)
+        if domain not in entry['stats']:
+            entry['stats'][domain] = read_domain_stats(entry['path'], domain)
+        return entry['stats'][domain]
+
+    def etag(self, filemeta):
+        """
+        Returns the hash of the results container of filemeta, read in blocks of HASH_BLOCK_SIZE bytes
+        """
+        entry = self.entry(filemeta)
+        if entry['etag'] is None:
+            digest = hashlib.sha1()
+            with open(entry['path'], 'rb') as container:
+                for block in iter(lambda: container.read(HASH_BLOCK_SIZE), b''):
+                    digest.update(block)
+            entry['etag'] = digest.hexdigest()
+        return entry['etag']
+
+
+result_cache = ResultCache(settings.RESULT_CACHE_SIZE)
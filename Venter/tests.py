@@ -1,19 +1,42 @@
 from django.contrib.auth.models import AnonymousUser, User
-from django.test import Client, RequestFactory, TestCase
-from .models import Organisation, Profile, Header
-from .helpers import create_org, create_profile
-# Testing model methods in accordance with the coverage.py report
-class ModelTestCase(TestCase):
+from django.core.management import call_command
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+import json
+import numpy as np
+import openpyxl
+import pandas as pd
+import os
+import subprocess
+import sys
+import tempfile
+from io import StringIO
+from unittest import mock
+from .models import File, Organisation, PredictionJob, Profile, Header
+from . import manipulate_csv, prediction_jobs, result_store
+from .ML_model.Civis import csvparser, sentencemodel
+from .ML_model.Civis.clustering import DisjointSet, clusterNeighbours, nearestNeighbours
+from .ML_model.Civis.neighbours import createNeighbourSearch
+from .ML_model import embeddings, numpy_graph
+from .ML_model.model import ClassificationService as mcgm_service
+from .ML_model.cache import PredictionCache, normalize_lowercase
+from .ML_model.tokenizer import MeanEmbeddingEncoder, QueryEncoder
+from .management.commands.startup_report import heavy_modules, startup_imports, total_time
+
+
+def create_org():
+    """Helper function for creating organisations."""
+    return Organisation.objects.create(organisation_name="Test Org")
 
-    # def create_org(self):
-    #     """Helper function for creating organisations."""
-    #     return Organisation.objects.create(organisation_name="Test Org")
 
-    # def create_profile(self):
-    #     """Helper function for creating test user and test profile."""
-    #     user = User.objects.create_user('Test')
-    #     org = self.create_org()
-    #     return Profile.objects.create(user=user, organisation_name=org)
+def create_profile():
+    """Helper function for creating test user and test profile."""
+    user = User.objects.create_user('Test')
+    org = create_org()
+    return Profile.objects.create(user=user, organisation_name=org)
+
+
+# Testing model methods in accordance with the coverage.py report
+class ModelTestCase(TestCase):
 
     def test_org_name(self):
         new_org = create_org()
@@ -38,7 +61,7 @@ class FileUploadTestCase(TestCase):
         self.client = Client(enforce_csrf_checks=True)
         self.client.force_login(demosuperuser)
 
-        url = '/venter/upload_csv/'
+        url = '/venter/upload_file/'
         response = self.client.get(url, format='json')
         self.assertEqual(response.status_code, 200)
         with open('log.txt', 'w') as f:
@@ -48,4 +71,634 @@ class FileUploadTestCase(TestCase):
         # with open('MEDIA\Test Files\demoicmc.csv') as f:
         #     response = self.client.post(url, {'csv_file': f})
         # self.assertEqual(response.status_code, 200)
-        
+
+
+class PredictionCacheTestCase(SimpleTestCase):
+
+    def predictor(self, calls):
+        def predict(texts):
+            calls.append(list(texts))
+            return np.array([[len(text), 0.5] for text in texts], dtype=np.float32)
+        return predict
+
+    def test_misses_are_predicted_once(self):
+        calls = []
+        cache = PredictionCache('test-1', normalize_lowercase)
+        texts = ['Pothole  on road', 'pothole on road', 'Garbage', None, 'garbage', 'Street light']
+        probs = cache.probabilities(texts, self.predictor(calls), batch_size=2)
+        self.assertEqual(calls, [['pothole on road', 'garbage'], ['', 'street light']])
+        np.testing.assert_array_equal(probs[:, 0], [15, 15, 7, 0, 7, 12])
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 4, 'entries': 4})
+
+        cache.probabilities(['GARBAGE', 'Drainage'], self.predictor(calls))
+        self.assertEqual(calls[-1], ['drainage'])
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = PredictionCache('test-1', max_entries=2)
+        cache.put_many(['a', 'b'], np.eye(2))
+        cache.get('a')
+        cache.put_many(['c'], np.eye(2)[:1])
+        self.assertEqual(list(cache.entries), ['a', 'c'])
+        self.assertIsNone(cache.get('b'))
+
+    def test_sqlite_tier_is_shared(self):
+        calls = []
+        probs = np.array([[0.1, 0.7, 0.2]], dtype=np.float32)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'predictions.sqlite3')
+            writer = PredictionCache('test-1', sqlite_path=path)
+            writer.put_many(['pothole'], probs)
+
+            # another process, with an empty memory tier
+            cache = PredictionCache('test-1', sqlite_path=path)
+            cached = cache.get('pothole')
+            self.assertEqual(cached.dtype, np.float32)
+            np.testing.assert_array_equal(cached, probs[0])
+            self.assertIn('pothole', cache.entries)
+
+            # a retrained model doesn't read the predictions of the previous one
+            retrained = PredictionCache('test-2', sqlite_path=path)
+            retrained.probabilities(['pothole'], self.predictor(calls))
+            self.assertEqual(calls, [['pothole']])
+            for db_cache in (writer, cache, retrained):
+                db_cache.db.close()
+
+
+class NovelClusteringTestCase(SimpleTestCase):
+
+    def test_chains_are_merged(self):
+        # 12000 synthetic novel responses in 3000 chains of 4, every response pointing to the next of its chain
+        responses = ['response %d' % i for i in range(12000)]
+        neighbours = [i + 1 if i % 4 != 3 else i - 3 for i in range(12000)]
+        groups = clusterNeighbours(responses, neighbours)
+        self.assertEqual(len(groups), 3000)
+        self.assertEqual(groups[0], ['response 0', 'response 1', 'response 2', 'response 3'])
+        self.assertEqual(sorted(sum(groups, [])), sorted(responses))
+
+    def test_random_neighbours(self):
+        rng = np.random.RandomState(0)
+        responses = ['response %d' % i for i in range(10000)]
+        neighbours = rng.randint(0, 10000, size=10000)
+        groups = clusterNeighbours(responses, neighbours)
+        group_of = {response: index for index, group in enumerate(groups) for response in group}
+        self.assertEqual(len(group_of), 10000)
+        for response, neighbour in zip(responses, neighbours):
+            self.assertEqual(group_of[response], group_of[responses[neighbour]])
+        # every group is connected, so it has at least as many edges as members - 1
+        forest = DisjointSet(10000)
+        for index, neighbour in enumerate(neighbours):
+            forest.union(index, neighbour)
+        self.assertEqual(len(groups), len({forest.find(index) for index in range(10000)}))
+
+    def test_duplicates_and_isolated_responses(self):
+        similarity_matrix = np.array([[-1, 0.8, 0.3], [0.8, -1, 0.5], [-0.2, 0.1, -1]])
+        # the last row has no positive sum, its response stays in a group of its own
+        self.assertEqual(list(nearestNeighbours(similarity_matrix)), [1, 0, 2])
+        # equal responses are a single member of their group
+        self.assertEqual(clusterNeighbours(['a', 'b', 'a', 'c'], [1, 0, 1, 3]), [['a', 'b'], ['c']])
+        self.assertEqual(clusterNeighbours([], nearestNeighbours(np.zeros((0, 0)))), [])
+
+
+class RandomWordModel:
+    """Stands in for the gensim word model with random vectors for a fixed vocabulary."""
+    vector_size = 20
+
+    def __init__(self, words):
+        rng = np.random.RandomState(0)
+        self.vocab = {word: rng.randn(self.vector_size).astype(np.float32) for word in words}
+
+    def __getitem__(self, word):
+        return self.vocab[word]
+
+
+def n_similarity(wordmodel, words1, words2):
+    """The n_similarity of gensim: cosine of the means of the raw word vectors."""
+    mean1 = np.mean([wordmodel[word] for word in words1], axis=0)
+    mean2 = np.mean([wordmodel[word] for word in words2], axis=0)
+    return mean1.dot(mean2) / np.linalg.norm(mean1) / np.linalg.norm(mean2)
+
+
+class CivisWordModelTestCase(SimpleTestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.words = ['word%d' % i for i in range(30)]
+        # vectors of different lengths, a mean of unit vectors would be another sentence embedding
+        self.vectors = (rng.randn(len(self.words), 20) * rng.uniform(0.1, 5, (len(self.words), 1))).astype(np.float32)
+
+    def test_vectors_are_read_raw(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'vectors.bin')
+            with open(path, 'wb') as word2vec_file:
+                word2vec_file.write(b'%d %d\n' % self.vectors.shape)
+                for word, vector in zip(self.words, self.vectors):
+                    word2vec_file.write(word.encode('utf-8') + b' ' + vector.tobytes() + b'\n')
+            with mock.patch.object(embeddings, 'CIVIS_WORDMODEL', path):
+                index, vectors = embeddings.read_civis(10, ['word25'])
+        self.assertEqual(index, dict({'word%d' % i: i for i in range(10)}, word25=10))
+        np.testing.assert_array_equal(vectors, self.vectors[list(range(10)) + [25]])
+
+    def test_similarity_matrix_is_n_similarity(self):
+        store = embeddings.EmbeddingStore(self.vectors[:25], {word: row for row, word in enumerate(self.words[:25])})
+        rng = np.random.RandomState(1)
+        texts = [' '.join(rng.choice(self.words, rng.randint(1, 6))) for _ in range(60)]
+        sentences = [sentencemodel.preprocess(text) for text in texts]
+        matrix = sentencemodel.similarityMatrix(sentences[:40], sentences[40:], store)
+        for row, s1 in enumerate(sentences[:40]):
+            for column, s2 in enumerate(sentences[40:]):
+                words1 = [word for word in s1.words if word in store]
+                words2 = [word for word in s2.words if word in store]
+                if s1.text == s2.text:
+                    expected = 1.0
+                elif not s1.words & s2.words or not words1 or not words2:
+                    expected = 0.0
+                else:
+                    expected = n_similarity(store, words1, words2)
+                self.assertAlmostEqual(matrix[row, column], expected, places=5)
+
+
+class NeighbourSearchTestCase(SimpleTestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        words = ['word%d' % i for i in range(300)]
+        self.wordmodel = RandomWordModel(words[:250])
+        self.responses = ['%d - %s' % (i, ' '.join(rng.choice(words, rng.randint(1, 6)))) for i in range(1500)]
+        self.responses += self.responses[:50]
+        self.sentences = [sentencemodel.preprocess(response.split('-')[1].lstrip()) for response in self.responses]
+        self.incidence, = sentencemodel.incidenceMatrices(self.sentences)
+        self.embeddings = sentencemodel.sentenceEmbeddings(self.sentences, self.wordmodel)
+        self.matrix = sentencemodel.similarityMatrix(self.sentences, self.sentences, self.wordmodel)
+        responses = np.array(self.responses, dtype=object)
+        self.matrix[responses[:, None] == responses[None, :]] = -1
+
+    def test_exact_matches_full_matrix(self):
+        search = createNeighbourSearch('exact', blockSize=128)
+        neighbours = search.nearest(self.embeddings, self.incidence, self.sentences, self.responses)
+        self.assertEqual(list(neighbours), list(nearestNeighbours(self.matrix)))
+
+    def test_lsh_links_positive_scores(self):
+        search = createNeighbourSearch('lsh', bits=4, tables=4)
+        neighbours = search.nearest(self.embeddings, self.incidence, self.sentences, self.responses)
+        for row, neighbour in enumerate(neighbours):
+            if neighbour != row:
+                self.assertGreater(self.matrix[row, neighbour], 0)
+
+    def test_lsh_links_equal_sentences_without_known_words(self):
+        search = createNeighbourSearch('lsh', bits=4, tables=4)
+        neighbours = search.nearest(self.embeddings, self.incidence, self.sentences, self.responses)
+        exact = nearestNeighbours(self.matrix)
+        unknown = [row for row in range(len(self.responses)) if not self.embeddings[row].any() and exact[row] != row]
+        self.assertTrue(unknown)
+        self.assertEqual([neighbours[row] for row in unknown], [exact[row] for row in unknown])
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            createNeighbourSearch('faiss')
+
+
+class DomainStateTestCase(SimpleTestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        words = ['word%d' % i for i in range(40)]
+        self.wordmodel = RandomWordModel(words)
+        self.wordmodel.version = 'v1'
+        self.responses = [' '.join(rng.choice(words, rng.randint(1, 6))) for _ in range(200)]
+        self.neighbourSearch = createNeighbourSearch('exact')
+
+    def categorize(self, categories, stateDirectory=None):
+        """Returns the results of the domain and the categories whose column was scored"""
+        with mock.patch.object(sentencemodel, 'readCategories', lambda domain: list(categories)), \
+                mock.patch.object(sentencemodel, 'similarityMatrix', wraps=sentencemodel.similarityMatrix) as scoring:
+            results, _ = sentencemodel.categorizeDomain(
+                'Water', self.responses, self.wordmodel, self.neighbourSearch, stateDirectory)
+        scored = [sentence.text for call in scoring.call_args_list for sentence in call[0][1]]
+        return results, scored
+
+    def test_only_new_categories_are_scored(self):
+        with tempfile.TemporaryDirectory() as directory:
+            _, scored = self.categorize(['word1 word2', 'word3', 'word4 word5'], directory)
+            self.assertEqual(scored, ['word1 word2', 'word3', 'word4 word5'])
+
+            # word3 is edited, word4 word5 removed and word6 added
+            results, scored = self.categorize(['word1 word2', 'word3 word7', 'word6'], directory)
+            self.assertEqual(scored, ['word3 word7', 'word6'])
+            self.assertEqual(list(results), ['word1 word2', 'word3 word7', 'word6', 'Novel'])
+            self.assertEqual(results, self.categorize(['word1 word2', 'word3 word7', 'word6'])[0])
+
+            _, scored = self.categorize(['word1 word2', 'word3 word7', 'word6'], directory)
+            self.assertEqual(scored, [])
+
+    def test_state_is_invalidated(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.categorize(['word1 word2', 'word3'], directory)
+            self.wordmodel.version = 'v2'
+            self.assertEqual(self.categorize(['word1 word2', 'word3'], directory)[1], ['word1 word2', 'word3'])
+            self.responses = self.responses[1:]
+            self.assertEqual(self.categorize(['word1 word2', 'word3'], directory)[1], ['word1 word2', 'word3'])
+
+
+class CivisWorkbookTestCase(SimpleTestCase):
+    """The Civis model over the sample workbook, with random vectors for its words."""
+    workbook = os.path.join(os.path.dirname(sentencemodel.__file__), 'Responses_All About the RMP2031.xlsx')
+
+    def test_parse(self):
+        domainResponses = csvparser.parse(self.workbook)
+        self.assertEqual(len(domainResponses), 13)
+        counts = {domain: len(responses) for domain, responses in domainResponses.items()}
+        self.assertEqual((counts['Traffic'], counts['Water'], counts['Heritage Conservation']), (292, 83, 7))
+        self.assertEqual(sum(counts.values()), 1047)
+        for responses in domainResponses.values():
+            for response in responses:
+                self.assertNotIn('\n', response)
+                self.assertEqual(response, response.lstrip())
+                self.assertNotIn(response, csvparser.MISSING_VALUES)
+
+    def test_parallel_domains(self):
+        domainResponses = csvparser.parse(self.workbook)
+        words = set(word for responses in domainResponses.values() for response in responses
+                    for word in response.split())
+        wordmodel = RandomWordModel(sorted(words))
+        wordmodel.version = None
+        # the pool is forked, its processes inherit the patched word model
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(sentencemodel, 'civis_embeddings', lambda: wordmodel):
+            sequential = sentencemodel.categorizer(domainResponses, workers=1, stateDirectory=directory)
+            parallel = sentencemodel.categorizer(domainResponses, workers=3, stateDirectory=directory)
+        self.assertEqual(list(parallel), sorted(domainResponses))
+        self.assertEqual(parallel, sequential)
+
+
+class ResultStoreTestCase(SimpleTestCase):
+
+    def test_domains_are_read_separately(self):
+        results = {
+            'Water': {'Supply': ['Fix the leaking pipes'], 'Novel': {'0': ['Rain water harvesting', 'Lakes']}},
+            'Traffic': {'Buses': [], 'Novel': {}},
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.bin')
+            result_store.write_results(path, results)
+            self.assertEqual(result_store.read_domain_list(path), ['Water', 'Traffic'])
+            self.assertEqual(result_store.read_domain(path, 'Water'), results['Water'])
+            self.assertEqual(result_store.read_domain(path, 'Traffic'), results['Traffic'])
+            with self.assertRaises(KeyError):
+                result_store.read_domain(path, 'Power')
+
+    def test_xlsx_export(self):
+        results = {
+            'Water': {'Supply': ['=Fix the leaking pipes', 'Meters'], 'Novel': {'0': ['Rain water harvesting']}},
+            'Roads/Traffic': {'Buses': [], 'Novel': {}},
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.xlsx')
+            result_store.write_xlsx(path, results)
+            workbook = openpyxl.load_workbook(path, read_only=True)
+            self.assertEqual(workbook.sheetnames, ['Water', 'Roads Traffic'])
+            self.assertEqual(list(workbook['Water'].values), [
+                ('Supply', 'Novel - Sub category 1'),
+                ('=Fix the leaking pipes', 'Rain water harvesting'),
+                ('Meters', None),
+            ])
+
+
+class QueryEncoderTestCase(SimpleTestCase):
+
+    def test_rows_are_padded_and_truncated(self):
+        encoder = QueryEncoder({'road': 0, 'pothole': 1, 'water': 2}, 4, 9)
+        data = encoder.encode(['Pothole on the road', 'road ' * 40, None, 'water  pothole'], flag=0)
+        self.assertEqual(data.dtype, np.int32)
+        self.assertEqual(data.tolist(), [[0, 9, 9, 9], [0, 0, 0, 0], [9, 9, 9, 9], [2, 1, 9, 9]])
+        self.assertEqual(encoder.encode(['pothole, road!'], flag=1).tolist(), [[1, 0, 9, 9]])
+
+
+class MeanEmbeddingEncoderTestCase(SimpleTestCase):
+
+    def test_rows_are_word_means(self):
+        vectors = np.array([[1, 0], [0, 2], [4, 4]], dtype=np.float32)
+        encoder = MeanEmbeddingEncoder({'road': 0, 'pothole': 1, 'water': 2}, vectors)
+        data = encoder.encode(['Pothole on the ROAD', 'nothing known', None, 'water', 'road road pothole'])
+        self.assertEqual(data.dtype, np.float32)
+        np.testing.assert_allclose(data, [[0.5, 1], [0, 0], [0, 0], [4, 4], [2 / 3, 2 / 3]])
+
+
+class NumpyGraphTestCase(SimpleTestCase):
+
+    def random_weights(self, shapes):
+        random = np.random.RandomState(0)
+        return {name: random.randn(*shape).astype(np.float32) * 0.1 for name, shape in shapes.items()}
+
+    def test_mcgm_forward_pass(self):
+        weights = self.random_weights({'Wa': (300, 512), 'ba': (512,), 'Wa1': (512, 512), 'ba1': (512,),
+                                       'Wa2': (512, 1), 'ba2': (1,), 'W': (300, 512), 'b': (512,),
+                                       'W1': (512, 512), 'b1': (512,), 'W2': (512, 165), 'b2': (165,)})
+        word_vectors = np.random.RandomState(1).randn(50, 300).astype(np.float32)
+        graph = numpy_graph.MCGMNumpyGraph(weights, {}, word_vectors)
+        data = np.random.RandomState(2).randint(0, 50, (4, 35))
+
+        # The ops of ImportGraph, one sentence at a time in float64
+        w = {name: value.astype(np.float64) for name, value in weights.items()}
+        expected = []
+        for row in data:
+            x = word_vectors[row].astype(np.float64)
+            h = np.maximum(np.maximum(x.dot(w['Wa']) + w['ba'], 0).dot(w['Wa1']) + w['ba1'], 0)
+            attention = np.exp((h.dot(w['Wa2']) + w['ba2'])[:, 0])
+            sentence = (x * (attention / attention.sum())[:, None]).sum(axis=0)
+            y = np.maximum(np.maximum(sentence.dot(w['W']) + w['b'], 0).dot(w['W1']) + w['b1'], 0)
+            logits = np.exp(y.dot(w['W2']) + w['b2'])
+            expected.append(logits / logits.sum())
+        np.testing.assert_allclose(graph.run(data), expected, rtol=1e-4)
+
+    def test_weights_round_trip(self):
+        weights = self.random_weights({'W1': (300, 128), 'b1': (128,), 'W2': (128, 14), 'b2': (14,)})
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model_weights.npz')
+            numpy_graph.save_weights(path, weights)
+            loaded = numpy_graph.load_weights(path)
+        self.assertEqual(sorted(loaded), sorted(weights))
+        for name in weights:
+            np.testing.assert_array_equal(loaded[name], weights[name])
+
+
+class StubGraph:
+    """Stands in for the MCGM graph, a complaint '4 95 7' is predicted as the categories 4, 95 and 7 in that order."""
+
+    def process_queries(self, lines, flag):
+        return lines
+
+    def run(self, lines):
+        probs = np.full((len(lines), 165), 0.001, dtype=np.float32)
+        for row, line in enumerate(lines):
+            for rank, word in enumerate(str(line).split()):
+                probs[row, int(word)] = 0.5 / (rank + 1)
+        return probs
+
+
+def stub_classification_service():
+    with mock.patch.object(mcgm_service, 'mcgm_graph', StubGraph):
+        return mcgm_service.ClassificationService()
+
+
+class ClassificationServiceTestCase(SimpleTestCase):
+
+    def test_top_k_categories(self):
+        service = stub_classification_service()
+        results = service.get_top_k_cats_batch(['4 95 7', '7 4 0'], k=3, batch_size=1)
+        self.assertEqual([list(result) for result in results], [
+            ['Person falling in Manhole', 'Outstanding dues pending', service.labels[7]],
+            [service.labels[7], 'Person falling in Manhole', service.labels[0]],
+        ])
+        self.assertAlmostEqual(results[0]['Person falling in Manhole'], 0.5)
+        self.assertAlmostEqual(results[1]['Person falling in Manhole'], 0.25)
+        self.assertEqual(service.get_top_k_cats_batch([]), [])
+
+
+class EditCsvTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.service = stub_classification_service()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        for folder in ('input', 'output'):
+            os.makedirs(os.path.join(self.directory.name, 'user', 'CSV', folder))
+
+    def predictions(self, group, rows):
+        input_path = os.path.join(self.directory.name, 'user', 'CSV', 'input', 'complaints.csv')
+        pd.DataFrame(rows).to_csv(input_path, index=False)
+        with override_settings(MEDIA_ROOT=self.directory.name), \
+                mock.patch.object(manipulate_csv, 'get_model', lambda group: self.service):
+            predictions = list(manipulate_csv.EditCsv('complaints.csv', 'user', group).iter_predictions(chunksize=2))
+        difference = pd.read_csv(os.path.join(self.directory.name, 'user', 'CSV', 'output', 'Difference.csv'),
+                                 keep_default_na=False)
+        return predictions, difference
+
+    def test_icmc_categories_are_translated(self):
+        labels = self.service.labels
+        self.assertEqual((labels[4], labels[95]), ('Person falling in Manhole', 'Outstanding dues pending'))
+        predictions, difference = self.predictions('ICMC', {
+            'complaint_title': ['4 95 7', '7 4 95', '95 7 4'],
+            'complaint_description': ['Manhole open', 'Dues', 'Road'],
+        })
+        self.assertEqual([prediction['index'] for prediction in predictions], [0, 1, 2])
+        self.assertEqual(predictions[0]['problem_description'], 'Manhole open')
+        self.assertEqual(predictions[0]['category'], [(labels[4], 50), (labels[95], 25), (labels[7], 16)])
+        self.assertEqual(predictions[2]['category'], [(labels[95], 50), (labels[7], 25), (labels[4], 16)])
+        self.assertEqual(difference.values.tolist(), [
+            [labels[4], labels[95], labels[7], 'Manhole open'],
+            [labels[7], labels[4], labels[95], 'Dues'],
+            [labels[95], labels[7], labels[4], 'Road'],
+        ])
+
+    def test_speakup_rows_without_text(self):
+        labels = self.service.labels
+        predictions, difference = self.predictions('SpeakUP', {'text': ['4 95 7', None, None, '7 4 95', None]})
+        self.assertEqual([prediction['category'] for prediction in predictions], [
+            [(labels[4], 50), (labels[95], 25), (labels[7], 16)],
+            [('None', 100)],
+            [('None', 100)],
+            [(labels[7], 50), (labels[4], 25), (labels[95], 16)],
+            [('None', 100)],
+        ])
+        self.assertEqual(predictions[1]['problem_description'], 'Problem description not found')
+        self.assertEqual(difference.values.tolist(), [
+            [labels[4], labels[95], labels[7], '4 95 7'],
+            ['None', '', '', 'Problem description not found'],
+            ['None', '', '', 'Problem description not found'],
+            [labels[7], labels[4], labels[95], '7 4 95'],
+            ['None', '', '', 'Problem description not found'],
+        ])
+
+
+class StartupImportTestCase(SimpleTestCase):
+
+    def test_urls_do_not_import_the_ml_stack(self):
+        modules, times = startup_imports()
+        self.assertIn('Venter.views', modules)
+        self.assertEqual(heavy_modules(modules), [], 'importing the urls took %.3f secs' % (total_time(times) / 1e6))
+        if sys.version_info >= (3, 7):
+            self.assertTrue(times)
+
+
+class PredictionJobTestCase(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'adminadmin')
+        profile = Profile.objects.create(user=user, organisation_name=Organisation.objects.create(
+            organisation_name='CIVIS'))
+        self.file = File.objects.create(uploaded_by=profile, input_file='responses.xlsx')
+        self.client = Client()
+        self.client.force_login(user)
+
+    def test_finished_jobs_are_not_queued_again(self):
+        url = '/venter/predict_result/%d' % self.file.pk
+        self.assertEqual(self.client.get(url).context['job'].state, PredictionJob.QUEUED)
+        self.client.get(url)
+        self.assertEqual(self.file.prediction_jobs.count(), 1)
+
+        PredictionJob.objects.update(state=PredictionJob.FAILED, error='Traceback\nValueError: bad sheet\n')
+        response = self.client.get(url)
+        self.assertContains(response, 'The prediction failed: ValueError: bad sheet')
+        self.assertNotContains(response, 'pollStatus')
+
+        # a workbook without any feedback column ends with a job done and no prediction
+        PredictionJob.objects.update(state=PredictionJob.DONE)
+        response = self.client.get(url)
+        self.assertContains(response, 'found no responses')
+        self.assertNotContains(response, 'pollStatus')
+        self.assertEqual(self.file.prediction_jobs.count(), 1)
+
+    def test_status(self):
+        url = '/venter/prediction_status/%d' % self.file.pk
+        self.assertEqual(self.client.get(url).json(), {'state': None})
+        prediction_jobs.enqueue(self.file)
+        self.assertEqual(self.client.get(url).json()['state'], PredictionJob.QUEUED)
+        self.assertEqual(self.client.get('/venter/prediction_status/%d' % (self.file.pk + 1)).status_code, 404)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    @override_settings(CIVIS_WORKERS=3)
+    def test_worker_runs_one_job_at_a_time_with_civis_workers(self):
+        output = StringIO()
+        call_command('run_prediction_worker', concurrency=2, once=True, stdout=output)
+        self.assertIn('running up to 1 jobs at a time', output.getvalue())
+
+    def test_queue(self):
+        job = prediction_jobs.enqueue(self.file)
+        self.assertEqual(prediction_jobs.enqueue(self.file), job)
+
+        claimed = prediction_jobs.claim_next_job()
+        self.assertEqual((claimed.pk, claimed.state, claimed.worker_pid), (job.pk, PredictionJob.RUNNING, os.getpid()))
+        self.assertIsNone(prediction_jobs.claim_next_job())
+        # a running job is still the active one
+        self.assertEqual(prediction_jobs.enqueue(self.file), job)
+
+        # the worker of the job is alive
+        self.assertEqual(prediction_jobs.requeue_stale_jobs(), 0)
+        finished = subprocess.Popen([sys.executable, '-c', ''])
+        finished.wait()
+        PredictionJob.objects.filter(pk=job.pk).update(worker_pid=finished.pid, domains_done=3)
+        self.assertEqual(prediction_jobs.requeue_stale_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.worker_pid, job.domains_done), (PredictionJob.QUEUED, None, 0))
+        self.assertEqual(prediction_jobs.claim_next_job().pk, job.pk)
+
+    def test_outputs_are_named_after_the_file(self):
+        # two files of a user uploaded on the same day share their output directory
+        other = File.objects.create(uploaded_by=self.file.uploaded_by, input_file='other.xlsx')
+        results = {self.file.pk: {'Water': {'Supply': ['Fix the pipes'], 'Novel': {}}},
+                   other.pk: {'Traffic': {'Buses': ['More buses'], 'Novel': {}}}}
+        with tempfile.TemporaryDirectory() as directory, override_settings(MEDIA_ROOT=directory):
+            for filemeta in (self.file, other):
+                mapping = mock.Mock(**{'driver.return_value': results[filemeta.pk]})
+                with mock.patch('Venter.ml.similarity_mapping', return_value=mapping):
+                    prediction_jobs.predict(filemeta)
+            for filemeta in (self.file, other):
+                filemeta.refresh_from_db()
+                with open(filemeta.output_file_json.name) as temp:
+                    self.assertEqual(json.load(temp), results[filemeta.pk])
+                workbook = openpyxl.load_workbook(filemeta.output_file_xlsx.name, read_only=True)
+                self.assertEqual(workbook.sheetnames, list(results[filemeta.pk]))
+            self.assertEqual(os.path.dirname(self.file.output_file_xlsx.name),
+                             os.path.dirname(other.output_file_xlsx.name))
+
+
+class ResultViewsTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        media = override_settings(MEDIA_ROOT=self.directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'adminadmin')
+        profile = Profile.objects.create(user=user, organisation_name=Organisation.objects.create(
+            organisation_name='CIVIS'))
+        self.file = File.objects.create(uploaded_by=profile, input_file='responses.xlsx', has_prediction=True)
+        self.results = {'Water': {'Supply': ['Fix the pipes', 'Meters'], 'Novel': {'0': ['Lakes']}}}
+        self.file.output_file_results = os.path.join(self.directory.name, result_store.results_filename(self.file))
+        result_store.write_results(self.file.output_file_results.name, self.results)
+        self.file.save()
+        self.client = Client()
+        self.client.force_login(user)
+
+    def test_domain_stats(self):
+        url = '/venter/domain_stats/%d' % self.file.pk
+        response = self.client.get(url, {'domain': 'Water'})
+        self.assertEqual(response.json(), result_store.domain_stats(self.results['Water']))
+        etag = response['ETag']
+
+        response = self.client.get(url, {'domain': 'Water'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(url, {'domain': 'Power'}).status_code, 404)
+        unknown_file = '/venter/domain_stats/%d' % (self.file.pk + 1)
+        self.assertEqual(self.client.get(unknown_file, {'domain': 'Water'}).status_code, 404)
+
+        # the results of the file are written again, the browser's copy is stale
+        self.results['Water']['Supply'].append('Tankers')
+        result_store.write_results(self.file.output_file_results.name, self.results)
+        os.utime(self.file.output_file_results.name, ns=(1, 1))
+        response = self.client.get(url, {'domain': 'Water'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[1], ['Supply', 3, ''])
+
+
+class ResultCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        media = override_settings(MEDIA_ROOT=self.directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.profile = create_profile()
+
+    def create_file(self, results):
+        filemeta = File.objects.create(uploaded_by=self.profile, input_file='responses.xlsx', has_prediction=True)
+        filemeta.output_file_results = os.path.join(self.directory.name, result_store.results_filename(filemeta))
+        result_store.write_results(filemeta.output_file_results.name, results)
+        filemeta.save()
+        return filemeta
+
+    def test_least_recently_used_file_is_evicted(self):
+        cache = result_store.ResultCache(max_files=2)
+        files = [self.create_file({'Domain %d' % index: {'Novel': {}}}) for index in range(3)]
+        self.assertEqual(cache.domain_list(files[0]), ['Domain 0'])
+        cache.domain_list(files[1])
+        cache.domain_list(files[0])
+        cache.domain_list(files[2])
+        self.assertEqual(list(cache.entries), [files[0].pk, files[2].pk])
+
+    def test_rewritten_container_is_read_again(self):
+        cache = result_store.ResultCache()
+        results = {'Water': {'Supply': ['Fix the pipes'], 'Novel': {}}}
+        filemeta = self.create_file(results)
+        with mock.patch.object(result_store, 'read_domain', wraps=result_store.read_domain) as read_domain:
+            self.assertEqual(cache.domain(filemeta, 'Water'), results['Water'])
+            cache.domain(filemeta, 'Water')
+            self.assertEqual(read_domain.call_count, 1)
+
+            results['Water']['Supply'].append('Tankers')
+            result_store.write_results(filemeta.output_file_results.name, results)
+            os.utime(filemeta.output_file_results.name, ns=(1, 1))
+            self.assertEqual(cache.domain(filemeta, 'Water'), results['Water'])
+            self.assertEqual(read_domain.call_count, 2)
+
+    def test_container_is_built_from_legacy_json(self):
+        # a file predicted before the containers existed only has its results.json
+        results = {'Water': {'Supply': ['Fix the pipes'], 'Novel': {'0': ['Lakes']}}, 'Traffic': {'Novel': {}}}
+        filemeta = File.objects.create(uploaded_by=self.profile, input_file='responses.xlsx', has_prediction=True)
+        filemeta.output_file_json = os.path.join(self.directory.name, 'results.json')
+        with open(filemeta.output_file_json.name, 'w') as temp:
+            json.dump(results, temp)
+        filemeta.save()
+
+        path = result_store.get_results_path(filemeta)
+        self.assertEqual(path, os.path.join(self.directory.name, result_store.results_filename(filemeta)))
+        self.assertEqual(File.objects.get(pk=filemeta.pk).output_file_results.path, path)
+        self.assertEqual(result_store.read_domain_list(path), ['Water', 'Traffic'])
+        self.assertEqual(result_store.read_domain(path, 'Water'), results['Water'])
+
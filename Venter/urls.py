@@ -34,8 +34,12 @@ urlpatterns = [
     # path('search_file/', views.FileSearchView.as_view(), name='search_file'),
     # ex: /venter/predict_result/5/
     path('predict_result/<int:pk>', views.predict_result, name='predict_result'),
-    # ex: /venter/domain_contents/
-    path('domain_contents/', views.domain_contents, name='domain_contents'),
+    # ex: /venter/prediction_status/5/
+    path('prediction_status/<int:pk>', views.prediction_status, name='prediction_status'),
+    # ex: /venter/domain_contents/5?domain=Water
+    path('domain_contents/<int:pk>', views.domain_contents, name='domain_contents'),
+    # ex: /venter/domain_stats/5?domain=Water
+    path('domain_stats/<int:pk>', views.domain_stats, name='domain_stats'),
     # path('predict/checkOutput/', views.handle_user_selected_data, name='checkOutput'),
     # ex: /venter/download_file/5/
     # path('download_file/<int:pk>', views.file_download, name='download_file'),
@@ -1,11 +1,8 @@
 import datetime
-import json
 import operator
 import os
 from functools import reduce
 
-import jsonpickle
-import pandas as pd
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import (LoginRequiredMixin,
@@ -15,23 +12,20 @@ from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from django.core.mail import mail_admins
 from django.db.models import Q
-from django.http import HttpResponse
-from django.shortcuts import redirect, render
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
 from django.views import generic
-from django.views.decorators.cache import never_cache
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.http import condition, require_http_methods
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from django.views.generic.list import ListView
 
-from Backend.settings import MEDIA_ROOT
-
 from Venter.forms import ContactForm, CSVForm, ExcelForm, ProfileForm, UserForm
 from Venter.helpers import get_result_file_path
-from Venter.models import Category, File, Profile
+from Venter.models import Category, File, PredictionJob, Profile
 
-from .manipulate_csv import EditCsv
-from .ML_model.Civis.modeldriver import SimilarityMapping
+from . import ml, prediction_jobs, result_store
 
 
 @login_required
@@ -113,7 +107,7 @@ def handle_user_selected_data(request):
                     # So here the correct_category will be needing a touple so the data will be like:
                     # [(selected_category1, selected_category2)] This will be the output of the multi select
                     correct_category.append(selected_category)
-        csv = EditCsv(file_name, user_name, company)
+        csv = ml.edit_csv(file_name, user_name, company)
         csv.write_file(correct_category)
         if request.POST['radio'] != "no":
             # If the user want to send the file to Google Drive
@@ -331,80 +325,90 @@ class FileListView(LoginRequiredMixin, ListView):
 
 @require_http_methods(["GET"])
 def predict_result(request, pk):
-    global dict_data, domain_list
+    """
+    View logic to show the Civis ML model results of an uploaded file.
 
-    filemeta = File.objects.get(pk=pk)
+    The model runs in the background (see prediction_jobs.py). If the file has no prediction yet, the state of
+    its latest PredictionJob is rendered instead: a page polling prediction_status while the job is queued or running,
+    its error if it failed, or that no response was found if it ended without results.
+    A job is only queued for a file which never had one, `manage.py recategorize_civis --file <pk>` runs one again.
+    """
+    filemeta = get_object_or_404(File, pk=pk)
     if not filemeta.has_prediction:
-        output_directory_path = os.path.join(MEDIA_ROOT, f'{filemeta.uploaded_by.organisation_name}/{filemeta.uploaded_by.user.username}/{filemeta.uploaded_date.date()}/output')
-
-        if not output_directory_path:
-            os.makedirs(output_directory_path)
-
-        output_file_path_json = os.path.join(output_directory_path, 'results.json')
-        output_file_path_xlsx = os.path.join(output_directory_path, 'results.xlsx')
-
-        sm = SimilarityMapping(filemeta.input_file.path)
-        dict_data = sm.driver()
-
-        if dict_data:
-            filemeta.has_prediction = True
-
-        with open(output_file_path_json, 'w') as temp:
-            json.dump(dict_data, temp)
+        job = filemeta.prediction_jobs.first()
+        if job is None:
+            job = prediction_jobs.enqueue(filemeta)
+        return render(request, './Venter/prediction_pending.html', {
+            'file': filemeta, 'job': job, 'error': job.error.strip().splitlines()[-1] if job.error else ''
+        })
 
-        print('JSON output saved.')
-        print('Done.')
-
-        filemeta.output_file_json = output_file_path_json
-
-        download_output = pd.ExcelWriter(output_file_path_xlsx, engine='xlsxwriter')
-
-        for domain in dict_data:
-            print('Writing Excel for domain %s' % domain)
-            df = pd.DataFrame({ key:pd.Series(value) for key, value in dict_data[domain].items() })
-            df.to_excel(download_output, sheet_name=domain)
-        download_output.save()
-
-        filemeta.output_file_xlsx = output_file_path_xlsx
-        filemeta.save()
-    else:
-        dict_data = json.load(filemeta.output_file_json)
-    dict_keys = dict_data.keys()
-    domain_list = list(dict_keys)
+    # Only the index of the results is read, the domains are loaded one at a time by domain_contents
+    domain_list = result_store.result_cache.domain_list(filemeta)
 
     return render(request, './Venter/prediction_result.html', {
-        'domain_list': domain_list, 'dict_data': dict_data
+        'file': filemeta, 'domain_list': domain_list
     })
 
 
+@login_required
 @require_http_methods(["GET"])
-def domain_contents(request):
-    global dict_data, domain_list
+def prediction_status(request, pk):
+    """
+    Returns the state and the per domain progress of the latest prediction job of a file as JSON
+    """
+    filemeta = get_object_or_404(File, pk=pk)
+    job = filemeta.prediction_jobs.first()
+    if job is None:
+        state = PredictionJob.DONE if filemeta.has_prediction else None
+        return JsonResponse({'state': state})
+
+    return JsonResponse({
+        'state': job.state,
+        'domains_done': job.domains_done,
+        'domains_total': job.domains_total,
+        'current_domain': job.current_domain,
+        'error': job.error.strip().splitlines()[-1] if job.error else '',
+    })
 
 
+@require_http_methods(["GET"])
+def domain_contents(request, pk):
+    """
+    View logic to show the Civis ML model results of one domain of an uploaded file.
+    The results are served by the result cache of the process, any worker can answer.
+    """
+    filemeta = get_object_or_404(File, pk=pk, has_prediction=True)
     domain_name = request.GET.get('domain')
-    domain_data = dict_data[domain_name]
-    temp = ['Category']
-    index = 0
-    for subCat in domain_data['Novel']:
-        temp.append('Sub category ' + str(index+1))
-        index += 1
-    temp.append({'role':'style'})
-    domain_stats = []
-    domain_stats.append(temp)
-
-    for category, responselist in domain_data.items():
-        column = [category, len(responselist), '']
-        if category == 'Novel':
-            column = ['Novel']
-            for subCat in domain_data[category]:
-                column.append(len(domain_data[category][subCat]))
-            column.append('')
-        else:
-            for i in range(len(domain_stats[0]) - len(column)):
-                column.insert(2,0)
-        domain_stats.append(column)
+    domain_list = result_store.result_cache.domain_list(filemeta)
+    if domain_name not in domain_list:
+        raise Http404('No domain %s in the results of this file' % domain_name)
+    domain_data = result_store.result_cache.domain(filemeta, domain_name)
 
     return render(request, './Venter/prediction_result.html', {
-        'domain_data': domain_data, 'domain_list': domain_list, 'domain_stats': jsonpickle.encode(domain_stats)
+        'file': filemeta, 'domain': domain_name, 'domain_data': domain_data, 'domain_list': domain_list
     })
+
+
+def domain_stats_etag(request, pk):
+    filemeta = File.objects.filter(pk=pk, has_prediction=True).first()
+    if filemeta is None:
+        return None
+    return result_store.result_cache.etag(filemeta)
+
+
+@login_required
+@require_http_methods(["GET"])
+@cache_control(private=True, max_age=0)
+@condition(etag_func=domain_stats_etag)
+def domain_stats(request, pk):
+    """
+    Returns the chart table of a domain of an uploaded file as JSON.
+    The tables are computed with the predictions (see result_store.py), the ETag is the hash of the results
+    so a browser showing the same domain again gets a 304 response.
+    """
+    filemeta = get_object_or_404(File, pk=pk, has_prediction=True)
+    try:
+        stats = result_store.result_cache.domain_stats(filemeta, request.GET.get('domain'))
+    except KeyError:
+        raise Http404('No such domain in the results of this file')
+    return HttpResponse(stats, content_type='application/json')
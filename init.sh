@@ -4,4 +4,8 @@ set -e
 echo "Starting SSH ..."
 service ssh start
 
+# The Civis predictions queued by the web app are executed by this worker
+echo "Starting the prediction worker ..."
+python /app/manage.py run_prediction_worker &
+
 python /app/manage.py runserver 0.0.0.0:8000